@@ -1,15 +1,101 @@
 # app/db.py
 import aiosqlite
+import asyncio
+import hashlib
+import os
+from itertools import combinations, cycle
 from dataclasses import dataclass
-from typing import Optional, List
+from typing import Callable, Optional, List, Dict, Set, Tuple
 from datetime import datetime, timedelta
 
 DB_FILE = "app/db/tasks.db"
 
+# Bump when the schema changes; init_db() skips migration once the
+# database's user_version has caught up.
+SCHEMA_VERSION = 5
+
+# Columns added after the original schema, for upgrading old databases
+_MIGRATION_COLUMNS = (
+    ("file_size", "INTEGER DEFAULT 0"),
+    ("audio_duration", "INTEGER DEFAULT 0"),
+    ("result_file", "TEXT"),
+    ("source_type", "TEXT DEFAULT 'upload'"),
+    ("source_url", "TEXT"),
+    ("content_hash", "BLOB"),
+)
+
+# Deleting fewer rows than this leaves freed pages for the next cleanup
+_INCREMENTAL_VACUUM_THRESHOLD = 50
+_INCREMENTAL_VACUUM_PAGES = 1000
+
+# Shared connections, opened once in init_db() and reused by every query:
+# a pool of read-only connections for lookups and one writer. Each aiosqlite
+# connection runs on its own thread, so lookups are spread round-robin over
+# the pool. SQLite allows a single writer at a time, so every write also
+# goes through _write_lock; readers don't need it because WAL gives them a
+# consistent snapshot.
+_READ_POOL_SIZE = os.cpu_count() or 4
+_read_pool: List[aiosqlite.Connection] = []
+_readers = None
+_db_w: Optional[aiosqlite.Connection] = None
+_write_lock = asyncio.Lock()
+
+_CONNECTION_PRAGMAS = (
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-64000",  # ~64MB
+    "PRAGMA mmap_size=268435456",  # 256MB
+    "PRAGMA busy_timeout=30000",
+)
+
+# Canonical SQL for the hot paths. sqlite3 keeps a per-connection cache of
+# prepared statements keyed by SQL text, so reusing these exact strings lets
+# repeated calls skip re-parsing.
+_TASK_COLUMNS = (
+    "id, api_key_hash, status, progress, filename, created_at, "
+    "file_size, audio_duration, result_file, error, source_type, source_url, content_hash"
+)
+_SQL_CREATE_TASK = (
+    "INSERT INTO tasks "
+    "(api_key_hash, status, progress, filename, created_at, file_size, audio_duration, source_type, source_url, content_hash) "
+    "VALUES (?, 'pending', 0, ?, CURRENT_TIMESTAMP, ?, ?, ?, ?, ?)"
+)
+_SQL_GET_TASK = f"SELECT {_TASK_COLUMNS} FROM tasks WHERE id = ?"
+_SQL_GET_TASKS_FOR_KEY = f"SELECT {_TASK_COLUMNS} FROM tasks WHERE api_key_hash = ? ORDER BY created_at DESC"
+_SQL_FIND_DONE_TASK = (
+    f"SELECT {_TASK_COLUMNS} FROM tasks "
+    "WHERE api_key_hash = ? AND content_hash = ? AND status = 'done' ORDER BY id DESC LIMIT 1"
+)
+
+# Every UPDATE variant update_task() can issue, keyed by the set of columns
+# being written. Columns always appear in _UPDATE_FIELDS order.
+_UPDATE_FIELDS = ("status", "progress", "result_file", "error", "file_size", "audio_duration", "filename")
+_UPDATE_SQLS = {
+    frozenset(cols): f"UPDATE tasks SET {', '.join(f'{c} = ?' for c in cols)} WHERE id = ?"
+    for k in range(1, len(_UPDATE_FIELDS) + 1)
+    for cols in combinations(_UPDATE_FIELDS, k)
+}
+_STATEMENT_CACHE_SIZE = 256
+
+# Progress-only updates are buffered here and written by a background
+# flusher at most every _PROGRESS_FLUSH_INTERVAL seconds, one commit per
+# batch. Any other update writes through immediately and takes the task's
+# pending progress with it.
+_PROGRESS_FLUSH_INTERVAL = 0.5
+_pending_progress: Dict[int, int] = {}
+_progress_event = asyncio.Event()
+_progress_flusher: Optional[asyncio.Task] = None
+
+# Listeners per api_key_hash, called with a task id after every committed
+# update to one of that key's tasks
+_task_listeners: Dict[bytes, Set[Callable[[int], None]]] = {}
+# Owner of each task created by this process that hasn't finished yet;
+# only those tasks are ever updated
+_task_owners: Dict[int, bytes] = {}
+
 @dataclass
 class Task:
     id: int
-    api_key: str
+    api_key_hash: bytes
     status: str
     progress: int
     filename: str
@@ -20,155 +106,353 @@ class Task:
     error: Optional[str] = None
     source_type: str = "upload"
     source_url: Optional[str] = None
+    # Identifies the input and output mode, so identical resubmissions can reuse a result
+    content_hash: Optional[bytes] = None
+
+async def _connect(database: str, **kwargs) -> aiosqlite.Connection:
+    conn = await aiosqlite.connect(database, cached_statements=_STATEMENT_CACHE_SIZE, **kwargs)
+    for pragma in _CONNECTION_PRAGMAS:
+        await conn.execute(pragma)
+    return conn
+
+def hash_api_key(api_key: str) -> bytes:
+    """Tasks are stored against a 16-byte SHA-256 prefix of the key, never the key itself"""
+    return hashlib.sha256(api_key.encode()).digest()[:16]
 
 async def init_db():
-    async with aiosqlite.connect(DB_FILE) as db:
-        await db.execute("""
-            CREATE TABLE IF NOT EXISTS tasks (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                api_key TEXT NOT NULL,
-                status TEXT NOT NULL,
-                progress INTEGER NOT NULL,
-                filename TEXT NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                file_size INTEGER DEFAULT 0,
-                audio_duration INTEGER DEFAULT 0,
-                result_file TEXT,
-                error TEXT,
-                source_type TEXT DEFAULT 'upload',
-                source_url TEXT
-            )
-        """)
-        await db.commit()
-        
-        # Check for migration
-        cursor = await db.execute("PRAGMA table_info(tasks)")
-        columns = await cursor.fetchall()
-        column_names = [col[1] for col in columns]
-        
-        # Add missing columns
-        if "file_size" not in column_names:
-            print("🔄 Migrating database schema...")
-            await db.execute("ALTER TABLE tasks ADD COLUMN file_size INTEGER DEFAULT 0")
-            await db.commit()
-        
-        if "audio_duration" not in column_names:
-            await db.execute("ALTER TABLE tasks ADD COLUMN audio_duration INTEGER DEFAULT 0")
-            await db.commit()
-        
-        if "result_file" not in column_names:
-            await db.execute("ALTER TABLE tasks ADD COLUMN result_file TEXT")
-            await db.commit()
-        
-        if "source_type" not in column_names:
-            print("🔄 Adding source_type column...")
-            await db.execute("ALTER TABLE tasks ADD COLUMN source_type TEXT DEFAULT 'upload'")
-            await db.commit()
-        
-        if "source_url" not in column_names:
-            print("🔄 Adding source_url column...")
-            await db.execute("ALTER TABLE tasks ADD COLUMN source_url TEXT")
-            await db.commit()
-            print("✅ Migration complete!")
+    global _readers, _db_w
+    if _db_w is None:
+        _db_w = await _connect(DB_FILE)
+        # Must precede journal_mode=WAL, which writes the header of a new file
+        await _db_w.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        await _db_w.execute("PRAGMA journal_mode=WAL")
+        await _db_w.execute("PRAGMA synchronous=NORMAL")
+
+    async with _write_lock:
+        await _migrate(_db_w)
+
+    # Opened after migration so the file and schema already exist
+    if not _read_pool:
+        for _ in range(_READ_POOL_SIZE):
+            reader = await _connect(f"file:{DB_FILE}?mode=ro", uri=True)
+            reader.row_factory = aiosqlite.Row
+            _read_pool.append(reader)
+        _readers = cycle(_read_pool)
+
+    global _progress_flusher
+    if _progress_flusher is None:
+        _progress_flusher = asyncio.create_task(_progress_flush_loop())
+
+def _pick_reader() -> aiosqlite.Connection:
+    return next(_readers)
+
+async def _migrate(db: aiosqlite.Connection):
+    cursor = await db.execute("PRAGMA user_version")
+    (version,) = await cursor.fetchone()
+    if version >= SCHEMA_VERSION:
+        return
+
+    # auto_vacuum only takes effect on an empty database or after a
+    # full VACUUM, so rebuild any file that was created without it
+    cursor = await db.execute("PRAGMA auto_vacuum")
+    (auto_vacuum,) = await cursor.fetchone()
+    if auto_vacuum != 2:  # 2 = INCREMENTAL
+        await db.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        await db.execute("VACUUM")
+        cursor = await db.execute("PRAGMA auto_vacuum")
+        (auto_vacuum,) = await cursor.fetchone()
+        if auto_vacuum != 2:
+            print(f"⚠️ Could not enable incremental auto-vacuum (auto_vacuum={auto_vacuum})")
+
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS tasks (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            api_key_hash BLOB NOT NULL,
+            status TEXT NOT NULL,
+            progress INTEGER NOT NULL,
+            filename TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            file_size INTEGER DEFAULT 0,
+            audio_duration INTEGER DEFAULT 0,
+            result_file TEXT,
+            error TEXT,
+            source_type TEXT DEFAULT 'upload',
+            source_url TEXT,
+            content_hash BLOB
+        )
+    """)
+
+    # Databases created before versioning may lack newer columns
+    cursor = await db.execute("PRAGMA table_info(tasks)")
+    column_names = {col[1] for col in await cursor.fetchall()}
+
+    missing = [(name, ddl) for name, ddl in _MIGRATION_COLUMNS if name not in column_names]
+    if missing:
+        print("🔄 Migrating database schema...")
+        for name, ddl in missing:
+            await db.execute(f"ALTER TABLE tasks ADD COLUMN {name} {ddl}")
+        print("✅ Migration complete!")
+
+    if "api_key" in column_names:
+        await _migrate_api_key_hash(db)
+
+    # get_tasks_for_key filters by key and sorts by time; cleanup
+    # filters by time alone
+    await db.execute(
+        "CREATE INDEX IF NOT EXISTS ix_tasks_keyhash_created ON tasks(api_key_hash, created_at DESC)"
+    )
+    await db.execute("CREATE INDEX IF NOT EXISTS ix_tasks_created ON tasks(created_at)")
+    await db.execute(
+        "CREATE INDEX IF NOT EXISTS ix_tasks_keyhash_content ON tasks(api_key_hash, content_hash) "
+        "WHERE content_hash IS NOT NULL"
+    )
+
+    await db.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+    await db.commit()
+
+async def _migrate_api_key_hash(db: aiosqlite.Connection):
+    """Replace the plaintext api_key column with api_key_hash"""
+    print("🔄 Hashing stored API keys...")
+    await db.execute("ALTER TABLE tasks ADD COLUMN api_key_hash BLOB")
+
+    cursor = await db.execute("SELECT id, api_key FROM tasks")
+    while rows := await cursor.fetchmany(500):
+        await db.executemany(
+            "UPDATE tasks SET api_key_hash = ? WHERE id = ?",
+            [(hash_api_key(api_key), task_id) for task_id, api_key in rows]
+        )
+
+    await db.execute("DROP INDEX IF EXISTS ix_tasks_apikey_created")
+    await db.execute("ALTER TABLE tasks DROP COLUMN api_key")
+    print("✅ API keys hashed!")
+
+async def optimize_db():
+    """Let SQLite refresh query planner statistics"""
+    async with _write_lock:
+        await _db_w.execute("PRAGMA optimize")
+
+async def _progress_flush_loop():
+    while True:
+        await _progress_event.wait()
+        await asyncio.sleep(_PROGRESS_FLUSH_INTERVAL)
+        _progress_event.clear()
+        try:
+            await flush_progress()
+        except Exception as e:
+            print(f"⚠️ Progress flush failed: {e}")
+
+async def flush_progress():
+    """Write all buffered progress updates in one transaction"""
+    global _pending_progress
+    async with _write_lock:
+        # Swapped under the lock so a concurrent direct update can't be
+        # overwritten by an older buffered value
+        if not _pending_progress:
+            return
+        pending, _pending_progress = _pending_progress, {}
+        await _db_w.executemany(
+            _UPDATE_SQLS[frozenset(("progress",))],
+            [(progress, task_id) for task_id, progress in pending.items()]
+        )
+        await _db_w.commit()
+    _notify_task_listeners(pending)
+
+def add_task_listener(api_key_hash: bytes, listener: Callable[[int], None]):
+    """Register a callback for updates to one key's tasks; it must not block"""
+    _task_listeners.setdefault(api_key_hash, set()).add(listener)
+
+def remove_task_listener(api_key_hash: bytes, listener: Callable[[int], None]):
+    listeners = _task_listeners.get(api_key_hash)
+    if listeners is not None:
+        listeners.discard(listener)
+        if not listeners:
+            del _task_listeners[api_key_hash]
+
+def _notify_task_listeners(task_ids):
+    for task_id in task_ids:
+        listeners = _task_listeners.get(_task_owners.get(task_id))
+        if listeners:
+            for listener in list(listeners):
+                listener(task_id)
+
+async def close_db():
+    """Close the shared connections"""
+    global _readers, _db_w, _progress_flusher
+    if _progress_flusher is not None:
+        _progress_flusher.cancel()
+        _progress_flusher = None
+    if _db_w is not None:
+        await flush_progress()
+    for reader in _read_pool:
+        await reader.close()
+    _read_pool.clear()
+    _readers = None
+    if _db_w is not None:
+        await _db_w.close()
+        _db_w = None
 
 async def create_task(
-    api_key: str, 
-    filename: str, 
-    file_size: int = 0, 
+    api_key: str,
+    filename: str,
+    file_size: int = 0,
     audio_duration: int = 0,
     source_type: str = "upload",
-    source_url: Optional[str] = None
+    source_url: Optional[str] = None,
+    content_hash: Optional[bytes] = None
 ) -> int:
     """Create a new task"""
-    async with aiosqlite.connect(DB_FILE) as db:
-        cursor = await db.execute(
-            """INSERT INTO tasks 
-            (api_key, status, progress, filename, created_at, file_size, audio_duration, source_type, source_url) 
-            VALUES (?, 'pending', 0, ?, CURRENT_TIMESTAMP, ?, ?, ?, ?)""",
-            (api_key, filename, file_size, audio_duration, source_type, source_url)
+    api_key_hash = hash_api_key(api_key)
+    async with _write_lock:
+        cursor = await _db_w.execute(
+            _SQL_CREATE_TASK,
+            (api_key_hash, filename, file_size, audio_duration, source_type, source_url, content_hash)
         )
-        await db.commit()
-        return cursor.lastrowid
+        await _db_w.commit()
+    _task_owners[cursor.lastrowid] = api_key_hash
+    return cursor.lastrowid
+
+async def create_tasks_bulk(rows: List[Tuple]) -> List[int]:
+    """
+    Create several tasks in one transaction
+    Each row is (api_key, filename, file_size, audio_duration, source_type, source_url, content_hash)
+    Returns the new task ids in row order
+    """
+    if not rows:
+        return []
+
+    rows = [(hash_api_key(row[0]), *row[1:]) for row in rows]
+
+    async with _write_lock:
+        await _db_w.execute("BEGIN")
+        try:
+            await _db_w.executemany(_SQL_CREATE_TASK, rows)
+            cursor = await _db_w.execute("SELECT last_insert_rowid()")
+            (last_id,) = await cursor.fetchone()
+            await _db_w.commit()
+        except Exception:
+            await _db_w.rollback()
+            raise
+
+    # Rows inserted in one transaction under the write lock get consecutive ids
+    task_ids = list(range(last_id - len(rows) + 1, last_id + 1))
+    for task_id, row in zip(task_ids, rows):
+        _task_owners[task_id] = row[0]
+    return task_ids
 
 async def update_task(
-    task_id: int, 
-    status: Optional[str] = None, 
-    progress: Optional[int] = None, 
-    result_file: Optional[str] = None, 
+    task_id: int,
+    status: Optional[str] = None,
+    progress: Optional[int] = None,
+    result_file: Optional[str] = None,
     error: Optional[str] = None,
     file_size: Optional[int] = None,
     audio_duration: Optional[int] = None,
     filename: Optional[str] = None
 ):
     """Update task fields"""
-    async with aiosqlite.connect(DB_FILE) as db:
-        updates = []
-        params = []
-        
-        if status is not None:
-            updates.append("status = ?")
-            params.append(status)
-        if progress is not None:
-            updates.append("progress = ?")
-            params.append(progress)
-        if result_file is not None:
-            updates.append("result_file = ?")
-            params.append(result_file)
-        if error is not None:
-            updates.append("error = ?")
-            params.append(error)
-        if file_size is not None:
-            updates.append("file_size = ?")
-            params.append(file_size)
-        if audio_duration is not None:
-            updates.append("audio_duration = ?")
-            params.append(audio_duration)
-        if filename is not None:
-            updates.append("filename = ?")
-            params.append(filename)
-        
-        if updates:
-            query = f"UPDATE tasks SET {', '.join(updates)} WHERE id = ?"
-            params.append(task_id)
-            await db.execute(query, params)
-            await db.commit()
+    values = {
+        "status": status,
+        "progress": progress,
+        "result_file": result_file,
+        "error": error,
+        "file_size": file_size,
+        "audio_duration": audio_duration,
+        "filename": filename,
+    }
+    fields = {k: v for k, v in values.items() if v is not None}
+    if not fields:
+        return
+
+    if progress is not None and len(fields) == 1 and _progress_flusher is not None:
+        _pending_progress[task_id] = progress
+        _progress_event.set()
+        return
+
+    async with _write_lock:
+        pending = _pending_progress.pop(task_id, None)
+        if pending is not None and "progress" not in fields:
+            fields["progress"] = pending
+
+        query = _UPDATE_SQLS[frozenset(fields)]
+        params = [fields[k] for k in _UPDATE_FIELDS if k in fields]
+        params.append(task_id)
+        await _db_w.execute(query, params)
+        await _db_w.commit()
+    _notify_task_listeners((task_id,))
+    if status in ("done", "error"):
+        _task_owners.pop(task_id, None)
+
+async def forget_content_hash(task_id: int):
+    """Keep a task's result from being reused for identical resubmissions"""
+    async with _write_lock:
+        await _db_w.execute("UPDATE tasks SET content_hash = NULL WHERE id = ?", (task_id,))
+        await _db_w.commit()
 
 async def get_task(task_id: int) -> Optional[Task]:
-    async with aiosqlite.connect(DB_FILE) as db:
-        cursor = await db.execute(
-            """SELECT id, api_key, status, progress, filename, created_at, 
-                      file_size, audio_duration, result_file, error, source_type, source_url 
-               FROM tasks WHERE id = ?""",
-            (task_id,)
-        )
+    async with _pick_reader().execute(_SQL_GET_TASK, (task_id,)) as cursor:
+        row = await cursor.fetchone()
+    if row:
+        return Task(*row)
+    return None
+
+async def find_done_task(api_key: str, content_hash: bytes) -> Optional[Task]:
+    """Latest finished task for this key with the same content hash, if any"""
+    async with _pick_reader().execute(_SQL_FIND_DONE_TASK, (hash_api_key(api_key), content_hash)) as cursor:
         row = await cursor.fetchone()
-        if row:
-            return Task(*row)
-        return None
+    if row:
+        return Task(*row)
+    return None
 
 async def get_tasks_for_key(api_key: str) -> List[Task]:
     """Get all tasks for a specific API key"""
-    async with aiosqlite.connect(DB_FILE) as db:
-        cursor = await db.execute(
-            """SELECT id, api_key, status, progress, filename, created_at, 
-                      file_size, audio_duration, result_file, error, source_type, source_url 
-               FROM tasks WHERE api_key = ? ORDER BY created_at DESC""",
-            (api_key,)
-        )
+    async with _pick_reader().execute(_SQL_GET_TASKS_FOR_KEY, (hash_api_key(api_key),)) as cursor:
         rows = await cursor.fetchall()
-        return [Task(*row) for row in rows]
-
-async def cleanup_old_tasks(days_old: int = 10):
-    """Delete tasks older than N days"""
-    async with aiosqlite.connect(DB_FILE) as db:
-        cursor = await db.execute(
-            "DELETE FROM tasks WHERE created_at < datetime('now', '-' || ? || ' days')",
-            (days_old,)
-        )
-        await db.commit()
+    return [Task(*row) for row in rows]
+
+async def get_tasks_for_key_raw(api_key: str) -> List[aiosqlite.Row]:
+    """
+    Get all tasks for a specific API key as sqlite rows
+    Cheaper than get_tasks_for_key for list views that only read fields by name
+    """
+    async with _pick_reader().execute(_SQL_GET_TASKS_FOR_KEY, (hash_api_key(api_key),)) as cursor:
+        return await cursor.fetchall()
+
+async def cleanup_old_tasks(days_old: int = 10) -> List[str]:
+    """
+    Delete tasks older than N days
+    Returns the result file paths of the deleted tasks so the caller can remove them
+    """
+    async with _write_lock:
+        await _db_w.execute("BEGIN")
+        try:
+            cursor = await _db_w.execute(
+                "SELECT result_file FROM tasks "
+                "WHERE created_at < datetime('now', '-' || ? || ' days') AND result_file IS NOT NULL",
+                (days_old,)
+            )
+            result_files = [row[0] for row in await cursor.fetchall()]
+
+            cursor = await _db_w.execute(
+                "DELETE FROM tasks WHERE created_at < datetime('now', '-' || ? || ' days')",
+                (days_old,)
+            )
+            await _db_w.commit()
+        except Exception:
+            await _db_w.rollback()
+            raise
+
         deleted_count = cursor.rowcount
         if deleted_count > 0:
             print(f"🧹 Cleaned up {deleted_count} old tasks")
-        
-        await db.execute("VACUUM")
-        await db.commit()
\ No newline at end of file
+
+        if deleted_count > _INCREMENTAL_VACUUM_THRESHOLD:
+            # Each step frees one page, so the cursor has to be drained
+            cursor = await _db_w.execute(f"PRAGMA incremental_vacuum({_INCREMENTAL_VACUUM_PAGES})")
+            await cursor.fetchall()
+
+    return result_files
+
+async def vacuum_db():
+    """Rebuild the database file; expensive, so only run occasionally"""
+    async with _write_lock:
+        await _db_w.execute("VACUUM")
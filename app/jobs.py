@@ -0,0 +1,58 @@
+# app/jobs.py
+import os
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Number of jobs (uploads / YouTube URLs) processed at the same time
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", 2))
+
+class JobQueue:
+    """
+    In-process worker pool for transcription jobs
+    Routes submit and return immediately; a fixed set of worker coroutines
+    runs the jobs, independent of the request that created them
+    """
+
+    def __init__(self, workers: int = JOB_WORKERS):
+        self.workers = max(1, workers)
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+
+    def start(self):
+        """Start the workers; call from the running event loop"""
+        if self._tasks:
+            return
+        self._queue = asyncio.Queue()
+        self._tasks = [
+            asyncio.create_task(self._worker(i)) for i in range(self.workers)
+        ]
+        logger.info("👷 Started %s job workers", self.workers)
+
+    async def stop(self):
+        """Cancel the workers; jobs still queued are dropped"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._queue = None
+
+    def submit(self, func: Callable[..., Awaitable[Any]], *args, **kwargs):
+        """Queue func(*args, **kwargs) to run on the next free worker"""
+        if self._queue is None:
+            raise RuntimeError("Job queue is not running")
+        self._queue.put_nowait((func, args, kwargs))
+
+    async def _worker(self, index: int):
+        while True:
+            func, args, kwargs = await self._queue.get()
+            try:
+                await func(*args, **kwargs)
+            except Exception as e:
+                logger.error("❌ Job %s failed on worker %s: %s", func.__name__, index, e, exc_info=True)
+            finally:
+                self._queue.task_done()
+
+job_queue = JobQueue()
@@ -1,22 +1,34 @@
 # app/main.py
-from fastapi import FastAPI, File, UploadFile, HTTPException, Form, Request, Depends, BackgroundTasks, Query
-from fastapi.responses import HTMLResponse, FileResponse, RedirectResponse
+from fastapi import FastAPI, HTTPException, Form, Request, Depends, Query
+from fastapi.responses import HTMLResponse, FileResponse, RedirectResponse, StreamingResponse, ORJSONResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
+import re
+import errno
 import secrets
+import hashlib
+import functools
 import os
 import logging
 import aiofiles
+import orjson
+import httpx
+import multipart
 import asyncio
-import glob
-import atexit
+import gc
+import time
 import tempfile
-from typing import List
-from datetime import datetime, timedelta
+import shutil
+from pathlib import Path
+from urllib.parse import quote_from_bytes
+from typing import Iterable, List
 from dotenv import load_dotenv
-from app.transcriber import transcribe_audio_file_streaming, summarize_with_gemini, get_audio_duration
-from app.db import create_task, update_task, get_task, get_tasks_for_key, init_db, cleanup_old_tasks
-from app.youtube_downloader import download_audio_from_url
+from multipart.multipart import parse_options_header
+from jinja2 import FileSystemBytecodeCache
+from app.transcriber import SEGMENT_DIR, SessionManager, transcribe_audio_file_streaming, summarize_with_gemini, get_audio_duration, has_segment_errors
+from app.db import Task, create_tasks_bulk, update_task, get_task, find_done_task, forget_content_hash, add_task_listener, remove_task_listener, get_tasks_for_key_raw, init_db, close_db, hash_api_key, optimize_db, vacuum_db, cleanup_old_tasks
+from app.youtube_downloader import YT_DOWNLOAD_DIR, download_audio_from_url
+from app.jobs import job_queue
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -30,106 +42,381 @@ VALID_API_KEY = os.getenv("VALID_API_KEY")
 if not VALID_API_KEY:
     raise ValueError("❌ VALID_API_KEY not set in .env")
 
-STATIC_DIR = os.path.join(os.path.dirname(__file__), 'static')
-RESULTS_DIR = os.path.join(os.path.dirname(__file__), 'results')
-UPLOAD_DIR = os.path.join(tempfile.gettempdir(), "audio_uploads")
-SEGMENT_DIR = os.path.join(tempfile.gettempdir(), "segments")
-YT_DOWNLOAD_DIR = os.path.join(tempfile.gettempdir(), "yt_downloads")
+# Compare fixed-size digests so the check doesn't depend on key length
+_VALID_KEY_DIGEST = hashlib.sha256(VALID_API_KEY.encode()).digest()
 
-for directory in [RESULTS_DIR, UPLOAD_DIR, SEGMENT_DIR, YT_DOWNLOAD_DIR]:
-    os.makedirs(directory, exist_ok=True)
+APP_DIR = Path(__file__).parent
+TEMP_ROOT = Path(tempfile.gettempdir())
 
-logger.info(f"📁 Results: {RESULTS_DIR}")
-logger.info(f"📁 Upload: {UPLOAD_DIR}")
-logger.info(f"📁 YouTube: {YT_DOWNLOAD_DIR}")
+STATIC_DIR = APP_DIR / "static"
+RESULTS_DIR = APP_DIR / "results"
+UPLOAD_DIR = TEMP_ROOT / "audio_uploads"
+# Segment and download dirs are defined (and created) by the modules that write to them
+TEMP_DIRS = (UPLOAD_DIR, Path(SEGMENT_DIR), Path(YT_DOWNLOAD_DIR))
+TEMP_FILE_MAX_AGE = 2 * 3600  # seconds
+
+RESULT_TEMPLATE = (
+    "================================================\n"
+    "AI 演講內容總結:\n"
+    "================================================\n"
+    "{summary}\n\n"
+    "================================================\n"
+    "完整轉錄文字稿:\n"
+    "================================================\n"
+    "{transcript}"
+)
+
+_URL_RE = re.compile(r'https?://\S+')
+
+SSE_KEEPALIVE_SECONDS = 15
+
+HTTP_USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", 1 << 20))  # 1MB
+UPLOAD_QUEUE_DEPTH = 8  # chunks buffered between network reads and disk writes
+MAX_UPLOAD_SIZE = 500 * 1024 * 1024
+# Limits for the rest of a multipart body, which is buffered in memory
+# before the api_key check can reject it
+MAX_FORM_FIELD_SIZE = 1024 * 1024
+MAX_FORM_PARTS = 1000
+MAX_PART_HEADER_SIZE = 16 * 1024
+ALLOWED_EXTENSIONS = frozenset({"mp3", "m4a", "wav"})
+
+for directory in (RESULTS_DIR, UPLOAD_DIR):
+    directory.mkdir(parents=True, exist_ok=True)
+
+logger.info("📁 Results: %s", RESULTS_DIR)
+logger.info("📁 Upload: %s", UPLOAD_DIR)
+logger.info("📁 YouTube: %s", YT_DOWNLOAD_DIR)
 
 app.mount("/static", StaticFiles(directory=STATIC_DIR), name="static")
 templates = Jinja2Templates(directory=STATIC_DIR)
+# Templates ship with the app and never change at runtime: skip the
+# per-render mtime check and keep compiled bytecode across restarts
+templates.env.auto_reload = False
+templates.env.bytecode_cache = FileSystemBytecodeCache()
+
+class ResultFileResponse(FileResponse):
+    # Transcripts are a few MB at most; send them in far fewer
+    # read/send round trips than Starlette's 64KB default
+    chunk_size = 1 << 21
 
 # === CLEANUP ===
-def cleanup_temp_files():
-    logger.info("🧹 Cleaning up temporary files...")
-    for directory in [UPLOAD_DIR, SEGMENT_DIR, YT_DOWNLOAD_DIR]:
-        pattern = os.path.join(directory, "*")
-        for file in glob.glob(pattern):
-            try:
-                os.remove(file)
-                logger.debug(f"Deleted: {file}")
-            except Exception as e:
-                logger.warning(f"Failed to delete {file}: {e}")
+def discard_file(path: str):
+    """Delete a per-task temp file once its task is finished"""
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        logger.warning("Failed to delete %s: %s", path, e)
+
+def _write_file(path: str, data: bytes):
+    # open + write + close in a single worker-thread hop (aiofiles hops per call)
+    with open(path, 'wb') as f:
+        f.write(data)
+
+def _sweep(directories: Iterable[Path], cutoff_ts: float) -> List[str]:
+    """Remove files in the given directories last modified before cutoff_ts"""
+    removed = []
+    for directory in directories:
+        try:
+            with os.scandir(directory) as it:
+                for entry in it:
+                    try:
+                        if entry.is_file() and entry.stat().st_mtime < cutoff_ts:
+                            os.unlink(entry.path)
+                            removed.append(entry.path)
+                    except OSError as e:
+                        logger.warning("Cleanup failed: %s", e)
+        except FileNotFoundError:
+            pass
+    return removed
 
 async def cleanup_old_temp_files():
     """Delete temp files older than 2 hours"""
-    now = datetime.now()
-    cutoff = now - timedelta(hours=2)
+    cutoff_ts = time.time() - TEMP_FILE_MAX_AGE
     
-    for directory in [UPLOAD_DIR, SEGMENT_DIR, YT_DOWNLOAD_DIR]:
-        pattern = os.path.join(directory, "*")
-        for file in glob.glob(pattern):
-            try:
-                file_time = datetime.fromtimestamp(os.path.getmtime(file))
-                if file_time < cutoff:
-                    os.remove(file)
-                    logger.info(f"🧹 Deleted old temp: {file}")
-            except Exception as e:
-                logger.warning(f"Cleanup failed: {e}")
+    # One worker-thread pass over all temp directories
+    removed = await asyncio.to_thread(_sweep, TEMP_DIRS, cutoff_ts)
+    for file in removed:
+        logger.info("🧹 Deleted old temp: %s", file)
 
-async def cleanup_old_result_files(days_old: int = 10):
-    """Delete result files older than 10 days"""
-    now = datetime.now()
-    cutoff = now - timedelta(days=days_old)
-    
-    pattern = os.path.join(RESULTS_DIR, "result_*.txt")
-    for file in glob.glob(pattern):
+def _remove_files(paths: List[str]):
+    for path in paths:
         try:
-            file_time = datetime.fromtimestamp(os.path.getmtime(file))
-            if file_time < cutoff:
-                os.remove(file)
-                logger.info(f"🧹 Deleted old result: {file}")
+            os.unlink(path)
+            logger.info("🧹 Deleted old result: %s", path)
+        except FileNotFoundError:
+            pass
         except Exception as e:
-            logger.warning(f"Cleanup failed: {e}")
+            logger.warning("Cleanup failed: %s", e)
+
+async def cleanup_expired_tasks(days_old: int = 10):
+    """Delete tasks older than N days together with their result files"""
+    result_files = await cleanup_old_tasks(days_old=days_old)
+    if result_files:
+        await asyncio.to_thread(_remove_files, result_files)
 
 async def periodic_cleanup():
-    """Run cleanup every 30 minutes"""
+    """Run cleanup every 30 minutes, and a full VACUUM once a week"""
+    last_vacuum = time.monotonic()
     while True:
         await asyncio.sleep(1800)
         await cleanup_old_temp_files()
-        await cleanup_old_result_files(days_old=10)
         
         try:
-            await cleanup_old_tasks(days_old=10)
+            await cleanup_expired_tasks(days_old=10)
         except Exception as e:
-            logger.error(f"DB cleanup failed: {e}")
+            logger.error("DB cleanup failed: %s", e)
 
-atexit.register(cleanup_temp_files)
+        if time.monotonic() - last_vacuum >= 7 * 24 * 3600:
+            try:
+                await vacuum_db()
+                last_vacuum = time.monotonic()
+            except Exception as e:
+                logger.error("DB vacuum failed: %s", e)
+
+async def periodic_optimize():
+    """Run PRAGMA optimize every 15 minutes"""
+    while True:
+        await asyncio.sleep(900)
+        try:
+            await optimize_db()
+        except Exception as e:
+            logger.error("DB optimize failed: %s", e)
 
 # === STARTUP/SHUTDOWN ===
 @app.on_event("startup")
 async def startup_event():
     await init_db()
-    await cleanup_old_tasks(days_old=10)
-    await cleanup_old_result_files(days_old=10)
+    await cleanup_expired_tasks(days_old=10)
+    job_queue.start()
+    
+    # One pooled HTTP/2 client for title lookups, so a batch of URLs shares connections
+    app.state.http = httpx.AsyncClient(
+        http2=True,
+        timeout=10.0,
+        limits=httpx.Limits(max_keepalive_connections=32),
+        headers={"User-Agent": HTTP_USER_AGENT},
+    )
+    
+    # Compile templates now rather than on the first request
+    for template in ("login.html", "status.html"):
+        templates.env.get_template(template)
     asyncio.create_task(periodic_cleanup())
+    asyncio.create_task(periodic_optimize())
+    
+    # Everything alive now lives for the whole process; keep the cyclic
+    # collector from rescanning it, and run full collections less often
+    gc.freeze()
+    gc.set_threshold(50000, 20, 20)
     logger.info("✅ App started with YouTube + batch processing (10-day retention)")
 
 @app.on_event("shutdown")
 async def shutdown_event():
-    cleanup_temp_files()
-    import gc
-    gc.collect()
+    await job_queue.stop()
+    await app.state.http.aclose()
+    await SessionManager.close()
+    await close_db()
     logger.info("👋 Shutdown complete")
 
 # === SECURITY ===
+@functools.lru_cache(maxsize=8)
+def _key_ok(digest: bytes) -> bool:
+    # Status polling presents the same key over and over; only digests
+    # are cached, never the keys themselves
+    return secrets.compare_digest(digest, _VALID_KEY_DIGEST)
+
+def _is_valid_api_key(api_key: str) -> bool:
+    return _key_ok(hashlib.sha256(api_key.encode()).digest())
+
 async def verify_api_key(api_key: str = Query(...)):
-    if not secrets.compare_digest(api_key, VALID_API_KEY):
+    if not _is_valid_api_key(api_key):
         raise HTTPException(status_code=401, detail="Invalid API key")
     return api_key
 
 async def verify_api_key_form(api_key: str = Form(...)):
-    if not secrets.compare_digest(api_key, VALID_API_KEY):
+    if not _is_valid_api_key(api_key):
         raise HTTPException(status_code=401, detail="Invalid API key")
     return api_key
 
+# === UPLOADS ===
+async def _drain_upload_queue(queue: asyncio.Queue, f):
+    """Write queued chunks until the None sentinel, joining whatever has piled up into one write"""
+    error = None
+    done = False
+    while not done:
+        batch = [await queue.get()]
+        while not queue.empty():
+            batch.append(queue.get_nowait())
+        if batch[-1] is None:
+            batch.pop()
+            done = True
+        # After a failed write keep draining so the reader never blocks on a full queue
+        if batch and error is None:
+            try:
+                await f.write(b"".join(batch))
+            except Exception as e:
+                error = e
+    if error is not None:
+        raise error
+
+def _extension(filename: str) -> str:
+    # Lowercases only the extension, not the whole (often long, multi-byte) name
+    _, dot, ext = filename.rpartition('.')
+    return ext.lower() if dot else ""
+
+class UploadSink:
+    """
+    Stream one uploaded file to disk, overlapping network reads with disk writes
+    The content is hashed on the way through for duplicate detection
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.size = 0
+        self.hasher = hashlib.sha256()
+        self._queue = asyncio.Queue(maxsize=UPLOAD_QUEUE_DEPTH)
+        self._file = None
+        self._writer = None
+
+    async def open(self):
+        self._file = await aiofiles.open(self.path, 'wb', buffering=UPLOAD_CHUNK_SIZE)
+        self._writer = asyncio.create_task(_drain_upload_queue(self._queue, self._file))
+
+    async def write(self, chunk):
+        self.hasher.update(chunk)
+        await self._queue.put(chunk)
+        self.size += len(chunk)
+
+    async def close(self) -> int:
+        """Flush and close the file; returns its size"""
+        try:
+            await self._queue.put(None)
+            await self._writer
+        finally:
+            await self._file.close()
+        return self.size
+
+    async def abort(self):
+        """Stop writing and delete the partial file"""
+        self._writer.cancel()
+        await asyncio.gather(self._writer, return_exceptions=True)
+        await self._file.close()
+        discard_file(self.path)
+
+# Events yielded by iter_multipart()
+PART_FIELD = "field"  # (PART_FIELD, name, value)
+PART_FILE = "file"    # (PART_FILE, name, filename), followed by its data
+PART_DATA = "data"    # (PART_DATA, None, chunk)
+PART_END = "end"      # (PART_END, name, None) after the last chunk of a file
+
+class _MultipartEvents:
+    """python-multipart callbacks that turn a multipart body into PART_* events"""
+
+    def __init__(self, charset: str):
+        self.charset = charset
+        self.events = []
+        self._header_name = b""
+        self._header_value = b""
+        self._disposition = b""
+        self._name = ""
+        self._is_file = False
+        self._field_data = []
+        self._field_size = 0
+        self._header_size = 0
+        self._parts = 0
+
+    def _decode(self, value: bytes) -> str:
+        try:
+            return value.decode(self.charset)
+        except (UnicodeDecodeError, LookupError):
+            return value.decode("latin-1")
+
+    def on_part_begin(self):
+        self._parts += 1
+        if self._parts > MAX_FORM_PARTS:
+            raise HTTPException(413, f"More than {MAX_FORM_PARTS} form parts")
+        self._disposition = b""
+        self._field_data = []
+        self._field_size = 0
+        self._header_size = 0
+
+    def _count_header_bytes(self, size: int):
+        self._header_size += size
+        if self._header_size > MAX_PART_HEADER_SIZE:
+            raise HTTPException(413, "Form part headers too large")
+
+    def on_header_field(self, data, start, end):
+        self._count_header_bytes(end - start)
+        self._header_name += data[start:end]
+
+    def on_header_value(self, data, start, end):
+        self._count_header_bytes(end - start)
+        self._header_value += data[start:end]
+
+    def on_header_end(self):
+        if self._header_name.lower() == b"content-disposition":
+            self._disposition = self._header_value
+        self._header_name = b""
+        self._header_value = b""
+
+    def on_headers_finished(self):
+        _, options = parse_options_header(self._disposition)
+        if b"name" not in options:
+            raise HTTPException(400, "Multipart part without a name")
+        self._name = self._decode(options[b"name"])
+        self._is_file = b"filename" in options
+        if self._is_file:
+            self.events.append((PART_FILE, self._name, self._decode(options[b"filename"])))
+
+    def on_part_data(self, data, start, end):
+        # A view, not a slice: file data reaches the disk writer without being copied
+        chunk = memoryview(data)[start:end]
+        if self._is_file:
+            self.events.append((PART_DATA, None, chunk))
+        else:
+            self._field_size += len(chunk)
+            if self._field_size > MAX_FORM_FIELD_SIZE:
+                raise HTTPException(413, f"Form field {self._name} too large")
+            self._field_data.append(chunk)
+
+    def on_part_end(self):
+        if self._is_file:
+            self.events.append((PART_END, self._name, None))
+        else:
+            self.events.append((PART_FIELD, self._name, self._decode(b"".join(self._field_data))))
+
+async def iter_multipart(request: Request):
+    """
+    Parse a multipart/form-data body straight off the request stream
+    Yields PART_* event tuples; file contents are never spooled in memory
+    """
+    _, params = parse_options_header(request.headers.get("content-type", ""))
+    boundary = params.get(b"boundary")
+    if not boundary:
+        raise HTTPException(400, "Expected a multipart/form-data body")
+    charset = params.get(b"charset", b"utf-8").decode("latin-1")
+    
+    handler = _MultipartEvents(charset)
+    parser = multipart.MultipartParser(boundary, {
+        "on_part_begin": handler.on_part_begin,
+        "on_header_field": handler.on_header_field,
+        "on_header_value": handler.on_header_value,
+        "on_header_end": handler.on_header_end,
+        "on_headers_finished": handler.on_headers_finished,
+        "on_part_data": handler.on_part_data,
+        "on_part_end": handler.on_part_end,
+    })
+    
+    async for chunk in request.stream():
+        parser.write(chunk)
+        for event in handler.events:
+            yield event
+        handler.events.clear()
+    parser.finalize()
+
 # === ROUTES ===
 @app.get("/login", response_class=HTMLResponse)
 async def login_page(request: Request):
@@ -149,7 +436,7 @@ async def home(request: Request, api_key: str = Query(None)):
     except HTTPException:
         return RedirectResponse(url="/login")
     
-    tasks = await get_tasks_for_key(api_key)
+    tasks = await get_tasks_for_key_raw(api_key)
     return templates.TemplateResponse("status.html", {
         "request": request, 
         "tasks": tasks, 
@@ -157,73 +444,147 @@ async def home(request: Request, api_key: str = Query(None)):
     })
 
 @app.post("/transcribe")
-async def transcribe_files(
-    background_tasks: BackgroundTasks,
-    files: List[UploadFile] = File(...),
-    summarize: str = Form("true"),
-    api_key: str = Depends(verify_api_key_form)
-):
-    """Handle multiple file uploads"""
-    if not files or all(f.filename == '' for f in files):
-        raise HTTPException(400, "No files provided")
-    
-    summarize_bool = summarize.lower() in ("true", "on", "1")
-    task_ids = []
+async def transcribe_files(request: Request):
+    """Handle multiple file uploads, streaming each file part straight to disk"""
+    fields = {}
+    uploads = []  # (filename, temp_path, file_size, content digest)
+    saw_file = False
+    sink = None
+    filename = None
     
-    for file in files:
-        if file.filename == '':
-            continue
-            
-        if not file.filename.lower().endswith(('.mp3', '.m4a', '.wav')):
-            logger.warning(f"Skipping unsupported: {file.filename}")
-            continue
-        
-        temp_filename = f"upload_{secrets.token_hex(8)}_{file.filename}"
-        temp_path = os.path.join(UPLOAD_DIR, temp_filename)
-        file_size = 0
-        
-        try:
-            logger.info(f"📥 Streaming upload: {file.filename}")
-            async with aiofiles.open(temp_path, 'wb') as f:
-                while chunk := await file.read(8192):
-                    await f.write(chunk)
-                    file_size += len(chunk)
-            
-            logger.info(f"✅ Upload complete: {file_size / 1024 / 1024:.2f}MB")
-            
-            if file_size > 500 * 1024 * 1024:
-                os.remove(temp_path)
-                continue
-            
-            audio_duration = await get_audio_duration(temp_path)
-            task_id = await create_task(
-                api_key, 
-                file.filename, 
-                file_size, 
-                audio_duration,
-                source_type="upload"
-            )
+    try:
+        async for event, name, value in iter_multipart(request):
+            if event is PART_DATA:
+                if sink is not None:
+                    await sink.write(value)
+                    if sink.size > MAX_UPLOAD_SIZE:
+                        logger.warning("Skipping oversized: %s", filename)
+                        await sink.abort()
+                        sink = None
             
-            background_tasks.add_task(
-                process_audio_from_file, 
-                temp_path, 
-                file.filename, 
-                summarize_bool, 
-                task_id
-            )
+            elif event is PART_FIELD:
+                fields[name] = value
+                # status.html sends the key ahead of the files, so a bad key
+                # is rejected before anything is written
+                if name == "api_key" and not _is_valid_api_key(value):
+                    raise HTTPException(status_code=401, detail="Invalid API key")
             
-            task_ids.append(task_id)
+            elif event is PART_FILE:
+                if name != "files" or value == '':
+                    continue
+                saw_file = True
+                filename = value
+                
+                if _extension(filename) not in ALLOWED_EXTENSIONS:
+                    logger.warning("Skipping unsupported: %s", filename)
+                    continue
+                
+                temp_filename = f"upload_{secrets.token_hex(8)}_{filename}"
+                logger.info("📥 Streaming upload: %s", filename)
+                sink = UploadSink(str(UPLOAD_DIR / temp_filename))
+                await sink.open()
             
-        except Exception as e:
-            if os.path.exists(temp_path):
-                os.remove(temp_path)
-            logger.error(f"Upload failed: {e}")
+            elif event is PART_END and sink is not None:
+                try:
+                    file_size = await sink.close()
+                    logger.info("✅ Upload complete: %.2fMB", file_size / 1024 / 1024)
+                    uploads.append((filename, sink.path, file_size, sink.hasher.digest()))
+                except Exception as e:
+                    discard_file(sink.path)
+                    logger.error("Upload failed: %s", e)
+                sink = None
+        
+        if sink is not None:
+            # The body ended without closing the last file part
+            logger.warning("Upload truncated: %s", filename)
+            await sink.abort()
+            sink = None
+        
+        api_key = fields.get("api_key")
+        if api_key is None or not _is_valid_api_key(api_key):
+            raise HTTPException(status_code=401, detail="Invalid API key")
+        
+        if not saw_file:
+            raise HTTPException(400, "No files provided")
+        
+        summarize_bool = fields.get("summarize", "true").lower() in ("true", "on", "1")
+        
+        durations, previous = await asyncio.gather(
+            asyncio.gather(*(get_audio_duration(temp_path) for _, temp_path, _, _ in uploads)),
+            asyncio.gather(*(
+                find_done_task(api_key, _content_hash(digest, summarize_bool, filename))
+                for filename, _, _, digest in uploads
+            )),
+        )
+    except BaseException:
+        if sink is not None:
+            await sink.abort()
+        for _, temp_path, _, _ in uploads:
+            discard_file(temp_path)
+        raise
+    rows = [
+        (api_key, filename, file_size, audio_duration, "upload", None, _content_hash(digest, summarize_bool, filename))
+        for (filename, _, file_size, digest), audio_duration in zip(uploads, durations)
+    ]
+    
+    try:
+        task_ids = await create_tasks_bulk(rows)
+    except Exception as e:
+        logger.error("❌ Failed to create tasks: %s", e, exc_info=True)
+        for _, temp_path, _, _ in uploads:
+            discard_file(temp_path)
+        task_ids = []
+    
+    for task_id, (filename, temp_path, _, _), duration, done in zip(task_ids, uploads, durations, previous):
+        if done is not None and await reuse_result(done, task_id):
+            discard_file(temp_path)
+            continue
+        job_queue.submit(
+            process_upload, 
+            temp_path, 
+            filename, 
+            summarize_bool, 
+            task_id,
+            duration
+        )
     
     if not task_ids:
         raise HTTPException(400, "No valid files")
     
     return {"task_ids": task_ids, "message": f"{len(task_ids)} tasks started"}
 
+def _content_hash(digest: bytes, summarize: bool, filename: str) -> bytes:
+    # The same audio gives a different result file with and without a
+    # summary, and the summary prompt includes the filename
+    if summarize:
+        return hashlib.sha256(digest + b"summary" + filename.encode()).digest()
+    return hashlib.sha256(digest + b"transcript").digest()
+
+def _link_file(src: str, dst: str):
+    # A hard link rather than a shared path: cleanup deletes each task's
+    # result file independently. A file left at dst by an earlier database
+    # is replaced; copying is only for filesystems that can't link.
+    discard_file(dst)
+    try:
+        os.link(src, dst)
+    except OSError as e:
+        if e.errno not in (errno.EXDEV, errno.EPERM):
+            raise
+        shutil.copyfile(src, dst)
+
+async def reuse_result(done: Task, task_id: int) -> bool:
+    """Finish task_id with an identical earlier task's result; False if that result is gone"""
+    result_file_path = str(RESULTS_DIR / f"result_{task_id}.txt")
+    try:
+        await asyncio.to_thread(_link_file, done.result_file, result_file_path)
+    except OSError as e:
+        logger.warning("Cannot reuse result of task %s: %s", done.id, e)
+        return False
+    
+    await update_task(task_id, status='done', progress=100, result_file=result_file_path)
+    logger.info("♻️ Task %s reused result of identical task %s", task_id, done.id)
+    return True
+
 async def extract_video_title(url: str) -> str:
     """
     Extract video title from URL without downloading
@@ -231,10 +592,10 @@ async def extract_video_title(url: str) -> str:
     """
     try:
         from app.youtube_downloader import extract_title_only
-        title = await extract_title_only(url)
+        title = await extract_title_only(url, app.state.http)
         return title if title else "YouTube Video"
     except Exception as e:
-        logger.warning(f"Failed to extract title: {e}")
+        logger.warning("Failed to extract title: %s", e)
         # Return a shortened URL as fallback
         if 'youtube.com' in url or 'youtu.be' in url:
             return "YouTube Video"
@@ -245,65 +606,53 @@ async def extract_video_title(url: str) -> str:
 
 @app.post("/transcribe-youtube")
 async def transcribe_youtube(
-    background_tasks: BackgroundTasks,
     urls: str = Form(...),
     summarize: str = Form("true"),
     api_key: str = Depends(verify_api_key_form)
 ):
     """Handle multiple YouTube URLs"""
-    logger.info(f"📥 Received YouTube request with URLs: {urls[:100]}")
+    logger.info("📥 Received YouTube request with URLs: %s", urls[:100])
     
     # Parse URLs
-    url_list = []
-    for line in urls.split('\n'):
-        line = line.strip()
-        if line and (line.startswith('http://') or line.startswith('https://')):
-            url_list.append(line)
+    url_list = _URL_RE.findall(urls)
     
-    logger.info(f"📊 Parsed {len(url_list)} URLs from input")
+    logger.info("📊 Parsed %s URLs from input", len(url_list))
     
     if not url_list:
-        logger.error(f"❌ No valid URLs found in: {urls}")
+        logger.error("❌ No valid URLs found in: %s", urls)
         raise HTTPException(400, "No valid URLs provided")
     
     summarize_bool = summarize.lower() in ("true", "on", "1")
-    task_ids = []
     
-    for idx, url in enumerate(url_list):
-        try:
-            logger.info(f"🔗 Creating task for URL {idx+1}: {url}")
-            
-            # Extract title before creating task
-            title = await extract_video_title(url)
-            
-            task_id = await create_task(
-                api_key=api_key,
-                filename=title,  # Use actual title instead of URL
-                file_size=0,
-                audio_duration=0,
-                source_type="youtube",
-                source_url=url
-            )
-            
-            logger.info(f"✅ Task {task_id} created for: {title}")
-            
-            background_tasks.add_task(
-                process_youtube_url,
-                url,
-                summarize_bool,
-                task_id
-            )
-            
-            task_ids.append(task_id)
-            
-        except Exception as e:
-            logger.error(f"❌ Failed to create task for URL {idx+1} ({url}): {e}", exc_info=True)
+    # Extract all titles concurrently before creating tasks
+    titles = await asyncio.gather(*(extract_video_title(url) for url in url_list))
+    
+    rows = []
+    for idx, (url, title) in enumerate(zip(url_list, titles)):
+        logger.info("🔗 Creating task for URL %s: %s", idx+1, url)
+        rows.append((api_key, title, 0, 0, "youtube", url, None))
+    
+    try:
+        task_ids = await create_tasks_bulk(rows)
+    except Exception as e:
+        logger.error("❌ Failed to create tasks: %s", e, exc_info=True)
+        task_ids = []
+    
+    for task_id, (_, title, _, _, _, url, _) in zip(task_ids, rows):
+        logger.info("✅ Task %s created for: %s", task_id, title)
+        
+        job_queue.submit(
+            process_youtube_url,
+            url,
+            summarize_bool,
+            task_id
+        )
     
     if not task_ids:
         logger.error("❌ No tasks were created")
         raise HTTPException(400, "Failed to create tasks for any URLs")
     
-    logger.info(f"✅ Created {len(task_ids)} tasks")
+    logger.info("✅ Created %s tasks", len(task_ids))
     return {"task_ids": task_ids, "message": f"{len(task_ids)} YouTube tasks started"}
 
 async def process_youtube_url(url: str, summarize: bool, task_id: int):
@@ -323,7 +672,7 @@ async def process_youtube_url(url: str, summarize: bool, task_id: int):
             elif "403" in error_msg:
                 error_msg = "存取被拒絕。YouTube 可能已封鎖此請求。"
             
-            logger.error(f"❌ YouTube task {task_id} failed: {error_msg}")
+            logger.error("❌ YouTube task %s failed: %s", task_id, error_msg)
             await update_task(task_id, status='error', progress=0, error=error_msg)
             return
         
@@ -337,26 +686,30 @@ async def process_youtube_url(url: str, summarize: bool, task_id: int):
             filename=title
         )
         
-        await process_audio_from_file(temp_path, title, summarize, task_id, initial_progress=10)
+        await process_audio_from_file(temp_path, title, summarize, task_id, initial_progress=10, duration_hint=duration)
         
     except Exception as e:
-        logger.error(f"❌ YouTube task {task_id} failed: {e}")
+        logger.error("❌ YouTube task %s failed: %s", task_id, e)
         await update_task(task_id, status='error', progress=0, error=str(e))
     
     finally:
-        if temp_path and os.path.exists(temp_path):
-            try:
-                os.remove(temp_path)
-                logger.info(f"🧹 Deleted YouTube download")
-            except Exception as e:
-                logger.warning(f"Failed to delete: {e}")
+        if temp_path:
+            await asyncio.to_thread(discard_file, temp_path)
+
+async def process_upload(file_path: str, filename: str, summarize: bool, task_id: int, duration: int = 0):
+    """Process an uploaded file, then delete it; duration is the one probed at upload"""
+    try:
+        await process_audio_from_file(file_path, filename, summarize, task_id, duration_hint=duration)
+    finally:
+        await asyncio.to_thread(discard_file, file_path)
 
 async def process_audio_from_file(
     file_path: str, 
     filename: str, 
     summarize: bool, 
     task_id: int,
-    initial_progress: int = 0
+    initial_progress: int = 0,
+    duration_hint: int = 0
 ):
     """Process audio file (from upload or YouTube)"""
     result_file_path = None
@@ -366,54 +719,40 @@ async def process_audio_from_file(
             file_path, 
             filename, 
             task_id,
-            initial_progress=initial_progress
+            initial_progress=initial_progress,
+            duration_hint=duration_hint
         )
         
+        complete = not has_segment_errors(transcript)
         if not summarize:
             result = transcript
         else:
             summary, info = await summarize_with_gemini(transcript, task_id, filename)
-            result = (
-                "================================================\n"
-                "AI 演講內容總結:\n"
-                "================================================\n"
-                f"{summary}\n\n"
-                "================================================\n"
-                "完整轉錄文字稿:\n"
-                "================================================\n"
-                f"{transcript}"
-            )
+            complete = complete and not info
+            result = RESULT_TEMPLATE.format(summary=summary, transcript=transcript)
         
-        result_file_path = os.path.join(RESULTS_DIR, f"result_{task_id}.txt")
-        async with aiofiles.open(result_file_path, 'w', encoding='utf-8') as f:
-            await f.write(result)
+        result_file_path = str(RESULTS_DIR / f"result_{task_id}.txt")
+        await asyncio.to_thread(_write_file, result_file_path, result.encode('utf-8'))
         
-        logger.info(f"💾 Result saved: {result_file_path}")
+        logger.info("💾 Result saved: %s", result_file_path)
         
+        if not complete:
+            # Cleared before the task is done, so a resubmission to retry the
+            # failed parts never gets this result back
+            await forget_content_hash(task_id)
         await update_task(task_id, status='done', progress=100, result_file=result_file_path)
-        logger.info(f"✅ Task {task_id} completed")
+        logger.info("✅ Task %s completed", task_id)
     
     except Exception as e:
-        logger.error(f"❌ Task {task_id} failed: {e}")
+        logger.error("❌ Task %s failed: %s", task_id, e)
         await update_task(task_id, status='error', progress=100, error=str(e))
-    
-    finally:
-        if os.path.exists(file_path):
-            try:
-                os.remove(file_path)
-            except Exception as e:
-                logger.warning(f"Failed to delete: {e}")
 
-@app.get("/status/{task_id}")
-async def get_status(task_id: int, api_key: str = Depends(verify_api_key)):
-    task = await get_task(task_id)
-    if not task or task.api_key != api_key:
-        raise HTTPException(404, "Task not found")
-    
+def _status_payload(task: Task) -> dict:
     # ✅ CHANGED: Check if result file exists
     has_result = task.result_file and os.path.exists(task.result_file)
     
     return {
+        "task_id": task.id,
         "status": task.status,
         "progress": task.progress,
         "error": task.error,
@@ -424,34 +763,81 @@ async def get_status(task_id: int, api_key: str = Depends(verify_api_key)):
         "source_type": getattr(task, 'source_type', 'upload')  # ✅ NEW: Return source type
     }
 
+@app.get("/status/{task_id}", response_class=ORJSONResponse)
+async def get_status(task_id: int, api_key: str = Depends(verify_api_key)):
+    task = await get_task(task_id)
+    if not task or task.api_key_hash != hash_api_key(api_key):
+        raise HTTPException(404, "Task not found")
+    
+    return _status_payload(task)
+
+@app.get("/events")
+async def task_events(api_key: str = Depends(verify_api_key)):
+    """Server-sent events: pushes a status payload whenever one of the key's tasks changes"""
+    key_hash = hash_api_key(api_key)
+    
+    async def stream():
+        # Registered here so the finally below always removes it, even if
+        # the response never starts streaming
+        queue: asyncio.Queue = asyncio.Queue()
+        add_task_listener(key_hash, queue.put_nowait)
+        try:
+            yield b": connected\n\n"
+            while True:
+                try:
+                    task_id = await asyncio.wait_for(queue.get(), timeout=SSE_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield b": keepalive\n\n"
+                    continue
+                
+                # Several updates to the same task since the last send collapse into one event
+                task_ids = {task_id}
+                while not queue.empty():
+                    task_ids.add(queue.get_nowait())
+                
+                for task_id in sorted(task_ids):
+                    task = await get_task(task_id)
+                    if task:
+                        yield b"data: " + orjson.dumps(_status_payload(task)) + b"\n\n"
+        finally:
+            remove_task_listener(key_hash, queue.put_nowait)
+    
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.get("/download/{task_id}")
 async def download(task_id: int, api_key: str = Depends(verify_api_key)):
     task = await get_task(task_id)
-    if not task or task.api_key != api_key:
+    if not task or task.api_key_hash != hash_api_key(api_key):
         raise HTTPException(404, "Task not found")
     
     if task.status != 'done' or not task.result_file:
         raise HTTPException(400, "Task not ready")
     
-    if not os.path.exists(task.result_file):
+    # One stat, off the event loop; FileResponse reuses it for its headers
+    try:
+        stat_result = await asyncio.to_thread(os.stat, task.result_file)
+    except FileNotFoundError:
         raise HTTPException(404, "Result file not found")
     
     original_name = task.filename.rsplit('.', 1)[0]
     download_filename = f"{original_name}_result.txt"
     
-    from urllib.parse import quote
-    filename_utf8 = quote(download_filename.encode('utf-8'), safe='')
+    filename_utf8 = quote_from_bytes(download_filename.encode('utf-8'), safe=b'')
     
-    return FileResponse(
+    return ResultFileResponse(
         path=task.result_file,
         media_type="text/plain; charset=utf-8",
-        filename=download_filename,
+        stat_result=stat_result,
         headers={
             "Content-Disposition": f"attachment; filename*=UTF-8''{filename_utf8}"
         }
     )
 
-@app.get("/health")
+@app.get("/health", response_class=ORJSONResponse)
 async def health():
     return {
         "status": "healthy",
@@ -1,18 +1,20 @@
 # app/transcriber.py
 import os
-import json
-import subprocess
+import re
+import math
 import time
-from typing import Tuple, List, Optional
+import hashlib
+from collections import OrderedDict
+from typing import AsyncIterator, Tuple, List, Optional
 from app.db import update_task
 from dotenv import load_dotenv
 import asyncio
 import logging
 import tempfile
-import requests
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
+import httpx
+import orjson
 import google.generativeai as genai
+from google.api_core import exceptions as google_exceptions
 
 logger = logging.getLogger(__name__)
 load_dotenv()
@@ -30,61 +32,205 @@ GROK_MODEL_NAME = os.getenv('AI_SUMMARY_API_MODEL_NAME', 'grok-3')
 if not GROK_API_AUTHORIZATION_HEADER:
     raise ValueError("❌ AI_SUMMARY_API_AUTHORIZATION_HEADER not set in .env")
 
+# Sent per request rather than set on the shared client, which also talks to Gemini
+GROK_HEADERS = httpx.Headers({
+    "Authorization": GROK_API_AUTHORIZATION_HEADER,
+    "Content-Type": "application/json"
+})
+
 # Configure Gemini (for transcription only)
 genai.configure(api_key=GEMINI_API_KEY)
 TRANSCRIPTION_MODEL = "gemini-2.0-flash"
+# Built once: generate_content doesn't mutate the model, so concurrent segments can share it
+transcription_model = genai.GenerativeModel(model_name=TRANSCRIPTION_MODEL)
+GEMINI_UPLOAD_URL = "https://generativelanguage.googleapis.com/upload/v1beta/files"
+# Headers every resumable upload starts with; size and type are added per file
+GEMINI_UPLOAD_START_HEADERS = {
+    "x-goog-api-key": GEMINI_API_KEY,
+    "X-Goog-Upload-Protocol": "resumable",
+    "X-Goog-Upload-Command": "start",
+}
+FILE_PROCESSING_TIMEOUT = 300  # seconds to wait for an uploaded file to become ACTIVE
+GENERATE_ATTEMPTS = 3  # generate_content tries per segment, reusing the same upload
+# Errors worth another generate_content call; anything else fails the segment
+TRANSIENT_GEMINI_ERRORS = (
+    google_exceptions.TooManyRequests,
+    google_exceptions.InternalServerError,
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.DeadlineExceeded,
+)
+TRANSCRIPTION_PROMPT = "Please provide a verbatim transcription of this audio file. Do not add titles, timestamps, or speaker labels unless necessary."
+
+# Summary prompt; filled with str.format(filename=..., transcript=...)
+SUMMARY_PROMPT_TEMPLATE = (
+    "請根據以下演講稿進行分析，並以繁體中文回答：\n"
+    "1. 回答以下問題並以 a, b, c 格式列點(只給答案)：\n"
+    "   a. 講者是否為安利的領袖？(回答：是/否)\n"
+    "   b. 講者的名字 (若{filename}和演講稿未提及，則回答：未提及)\n"
+    "   c. 演講的主題 (若{filename}和演講稿未提及，則回答：未提及)\n"
+    "2. 根據上述分析，判斷講者是否為安利領袖。若是，則在總結中使用「安利領袖」稱呼講者；若否，則僅使用「講者」或講者姓名（若已知）。"
+    "請詳細歸納演講內容。\n\n"
+    "演講稿:\n{transcript}"
+)
 
 # Audio Processing
 SEGMENT_DURATION = 10 * 60  # 10 minutes per chunk
+# Floor for splitting short files finer; every cut can split a sentence
+MIN_SEGMENT_DURATION = 3 * 60
+SEGMENT_CONCURRENCY = int(os.getenv("SEGMENT_CONCURRENCY", 4))  # segments in flight per file
+SEGMENT_PREFETCH = 2  # finished segments handed to workers ahead of time
+FFMPEG_THREADS = int(os.getenv("FFMPEG_THREADS", 2))  # per ffmpeg process
+GEMINI_MAX_RPS = float(os.getenv("GEMINI_MAX_RPS", 5))  # Gemini requests per second, all tasks combined
+API_CONCURRENCY = int(os.getenv("API_CONCURRENCY", 8))  # Gemini/Grok requests in flight, all tasks combined
+PROBE_CONCURRENCY = int(os.getenv("PROBE_CONCURRENCY", min(4, os.cpu_count() or 2)))  # ffprobe processes at once
 
 SEGMENT_DIR = os.path.join(tempfile.gettempdir(), "segments")
 os.makedirs(SEGMENT_DIR, exist_ok=True)
 
+def _remove_quietly(path: str) -> bool:
+    """Delete a file in one syscall; returns False if it was already gone"""
+    try:
+        os.remove(path)
+        return True
+    except FileNotFoundError:
+        return False
+    except OSError as e:
+        logger.warning(f"Failed to delete {path}: {e}")
+        return False
+
 # ============================================================================
-# SESSION MANAGEMENT FOR GROK API
+# SESSION MANAGEMENT (Grok API + Gemini uploads)
 # ============================================================================
 
 class SessionManager:
-    """Manages HTTP sessions with retry logic for Grok API"""
+    """
+    Manages the shared async HTTP client for Grok API and Gemini uploads
+    Pooled keep-alive connections save a TCP + TLS handshake per request,
+    and requests wait on the event loop instead of holding a worker thread
+    """
     
-    _session = None
+    _client: Optional[httpx.AsyncClient] = None
     
     @classmethod
-    def get_session(cls) -> requests.Session:
-        """Get or create a requests session with retry strategy"""
-        if cls._session is None:
-            cls._session = cls._create_session()
-        return cls._session
-    
-    @staticmethod
-    def _create_session() -> requests.Session:
-        """Create a session with connection pooling and retry strategy"""
-        session = requests.Session()
-        
-        retry_strategy = Retry(
-            total=3,
-            backoff_factor=1,
-            status_forcelist=[429, 500, 502, 503, 504],
-            allowed_methods=["POST", "GET"]
-        )
-        
-        adapter = HTTPAdapter(
-            max_retries=retry_strategy,
-            pool_connections=10,
-            pool_maxsize=10
-        )
-        
-        session.mount("http://", adapter)
-        session.mount("https://", adapter)
-        
-        return session
+    def get_client(cls) -> httpx.AsyncClient:
+        """Get or create the client"""
+        if cls._client is None:
+            # Pool settings live on the transport: httpx ignores the client's
+            # limits once a transport is passed in
+            transport = httpx.AsyncHTTPTransport(
+                # Retries refused/reset connections; status codes are retried in post_with_retry
+                retries=3,
+                # Concurrent segment uploads to Gemini share one multiplexed
+                # connection; hosts without HTTP/2 negotiate HTTP/1.1.
+                # generate_content and get_file go through the genai SDK's
+                # own transport, not this client
+                http2=True,
+                limits=httpx.Limits(
+                    max_connections=32,
+                    max_keepalive_connections=16,  # concurrent segment uploads + summaries per host
+                    keepalive_expiry=60
+                )
+            )
+            cls._client = httpx.AsyncClient(transport=transport)
+        return cls._client
     
     @classmethod
-    def close(cls):
-        """Close the session"""
-        if cls._session:
-            cls._session.close()
-            cls._session = None
+    async def close(cls):
+        """Close the client"""
+        if cls._client:
+            await cls._client.aclose()
+            cls._client = None
+
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+MAX_RETRIES = 3
+
+async def post_with_retry(url: str, limiter: Optional["TokenBucket"] = None, **kwargs) -> httpx.Response:
+    """
+    POST through the shared client, retrying 429/5xx with exponential backoff
+    A 429 also throttles `limiter`, the rate limiter for that API
+    """
+    client = SessionManager.get_client()
+    for attempt in range(MAX_RETRIES + 1):
+        async with api_semaphore:
+            response = await client.post(url, **kwargs)
+        if response.status_code == 429 and limiter is not None:
+            limiter.throttle()
+        if response.status_code not in RETRY_STATUSES or attempt == MAX_RETRIES:
+            return response
+        retry_after = response.headers.get("Retry-After", "")
+        delay = float(retry_after) if retry_after.isdigit() else 2 ** attempt
+        logger.warning(f"HTTP {response.status_code} from {response.url.host}, retrying in {delay:.0f}s")
+        await response.aclose()
+        await asyncio.sleep(delay)
+
+# ============================================================================
+# RATE LIMITING
+# ============================================================================
+
+class TokenBucket:
+    """
+    Async token bucket: `rate` acquisitions per second on average, with
+    bursts of up to `capacity`. Callers only wait when over the limit.
+    throttle() halves the rate when the API pushes back; each acquisition
+    then wins back a little of it, up to the configured rate.
+    """
+    
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        if rate <= 0:
+            raise ValueError(f"TokenBucket rate must be positive, got {rate}")
+        self.max_rate = rate
+        self.rate = rate
+        # Room for at least one token, or a sub-1 rate could never acquire
+        self.capacity = max(1.0, capacity or rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+    
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+    
+    def throttle(self):
+        self.rate = max(self.max_rate / 16, self.rate / 2)
+    
+    async def __aenter__(self):
+        await self.acquire()
+    
+    async def __aexit__(self, *exc):
+        return False
+
+gemini_limiter = TokenBucket(GEMINI_MAX_RPS)
+# The token bucket paces how often requests start; this caps how many are
+# outstanding at once, since a generate_content call can take a minute
+api_semaphore = asyncio.Semaphore(API_CONCURRENCY)
+# A multi-file upload probes every file at once. Segmenting ffmpeg runs
+# are already bounded by the job queue (one per job).
+probe_semaphore = asyncio.Semaphore(PROBE_CONCURRENCY)
+
+# ============================================================================
+# SUBPROCESS OUTPUT
+# ============================================================================
+
+ERROR_TAIL_BYTES = 200  # of ffmpeg/ffprobe stderr kept for error messages
+
+def _error_tail(output: bytes) -> str:
+    # Only the tail is decoded; a cut multi-byte character at its start is dropped
+    return output[-ERROR_TAIL_BYTES:].decode('utf-8', errors='ignore').strip()
+
+async def _read_tail(stream: asyncio.StreamReader, chunk_size: int = 64 * 1024) -> bytes:
+    """Drain stream to EOF, keeping only its last ERROR_TAIL_BYTES"""
+    tail = b""
+    while chunk := await stream.read(chunk_size):
+        tail = (tail + chunk)[-ERROR_TAIL_BYTES:]
+    return tail
 
 # ============================================================================
 # AUDIO DURATION
@@ -93,26 +239,28 @@ class SessionManager:
 async def get_audio_duration(file_path: str) -> int:
     """Get audio duration without loading file into memory"""
     try:
-        result = subprocess.run(
-            [
-                'ffprobe', '-v', 'quiet', 
-                '-print_format', 'json', 
-                '-show_format', 
-                file_path
-            ],
-            capture_output=True,
-            text=True,
-            encoding='utf-8',
-            errors='ignore',
-            timeout=30
-        )
+        async with probe_semaphore:
+            proc = await asyncio.create_subprocess_exec(
+                'ffprobe', '-v', 'error',
+                '-show_entries', 'format=duration',
+                '-of', 'default=noprint_wrappers=1:nokey=1',
+                file_path,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE
+            )
+            try:
+                stdout, stderr = await asyncio.wait_for(proc.communicate(), timeout=30)
+            except asyncio.TimeoutError:
+                proc.kill()
+                await proc.wait()
+                raise
         
-        if result.returncode != 0 or not result.stdout or result.stdout.strip() == '':
-            logger.warning(f"FFprobe failed or returned empty")
+        output = stdout.decode('utf-8', errors='ignore').strip()
+        if proc.returncode != 0 or not output:
+            logger.warning(f"FFprobe failed or returned empty: {_error_tail(stderr)}")
             return 0
         
-        data = json.loads(result.stdout)
-        duration = int(float(data['format']['duration']))
+        duration = int(float(output))
         logger.info(f"📊 Audio duration: {duration}s ({duration/60:.1f}min)")
         return duration
     
@@ -124,168 +272,406 @@ async def get_audio_duration(file_path: str) -> int:
 # TRANSCRIPTION (Gemini - unchanged)
 # ============================================================================
 
+async def _upload_to_gemini(data: bytes, display_name: str, mime_type: str = "audio/mpeg") -> genai.types.File:
+    """Upload a file to the Gemini File API with the resumable protocol"""
+    size = len(data)
+    
+    start = await post_with_retry(
+        GEMINI_UPLOAD_URL,
+        limiter=gemini_limiter,
+        headers={
+            **GEMINI_UPLOAD_START_HEADERS,
+            "X-Goog-Upload-Header-Content-Length": str(size),
+            "X-Goog-Upload-Header-Content-Type": mime_type,
+        },
+        json={"file": {"display_name": display_name}},
+        timeout=60
+    )
+    start.raise_for_status()
+    
+    response = await post_with_retry(
+        start.headers["X-Goog-Upload-URL"],
+        limiter=gemini_limiter,
+        content=data,
+        headers={
+            "X-Goog-Upload-Offset": "0",
+            "X-Goog-Upload-Command": "upload, finalize",
+        },
+        timeout=300
+    )
+    response.raise_for_status()
+    
+    # The finalize response already describes the file; no get_file round trip needed
+    file_json = orjson.dumps(orjson.loads(response.content)["file"])
+    return genai.types.File(genai.protos.File.from_json(file_json, ignore_unknown_fields=True))
+
+# Re-encode settings for inputs that can't be stream-copied. Gemini
+# downsamples audio to 16kHz mono anyway, so anything richer only costs
+# encoder time and upload bytes; compression_level 7 is LAME's fast path.
+_TRANSCODE_ARGS = (
+    '-threads', str(FFMPEG_THREADS),
+    '-ar', '16000',
+    '-ac', '1',
+    '-b:a', '48k',
+    '-acodec', 'libmp3lame',
+    '-compression_level', '7',
+)
+
+# Inputs whose audio can be split without re-encoding, and the container the
+# copied packets go into: AAC from an .m4a is written as raw ADTS, which
+# Gemini accepts as audio/aac
+COPY_SEGMENT_FORMATS = {".mp3": ".mp3", ".m4a": ".aac"}
+SEGMENT_MIME_TYPES = {".mp3": "audio/mpeg", ".aac": "audio/aac"}
+
+def _can_copy(file_path: str) -> bool:
+    return os.path.splitext(file_path)[1].lower() in COPY_SEGMENT_FORMATS
+
+def _segment_duration(duration_seconds: int) -> int:
+    """
+    Segment length for a file: short files are spread over all
+    SEGMENT_CONCURRENCY workers instead of leaving most of them idle.
+    SEGMENT_DURATION stays the ceiling, since a segment's transcript has
+    to fit in one response's output token limit.
+    """
+    spread = math.ceil(duration_seconds / SEGMENT_CONCURRENCY)
+    return min(SEGMENT_DURATION, max(MIN_SEGMENT_DURATION, spread))
+
+async def _split_audio(file_path: str, task_id: int, copy: bool, segment_time: int) -> AsyncIterator[str]:
+    """
+    Split file_path into segment_time pieces with a single ffmpeg pass
+    Yields each segment path as soon as ffmpeg has finished writing it
+    """
+    ext = COPY_SEGMENT_FORMATS[os.path.splitext(file_path)[1].lower()] if copy else ".mp3"
+    pattern = os.path.join(SEGMENT_DIR, f"seg_{task_id}_%03d{ext}")
+    proc = await asyncio.create_subprocess_exec(
+        'ffmpeg', '-y', '-v', 'error',
+        '-i', file_path,
+        '-vn',
+        *(('-c:a', 'copy') if copy else _TRANSCODE_ARGS),
+        '-f', 'segment',
+        '-segment_time', str(segment_time),
+        '-reset_timestamps', '1',
+        # ffmpeg prints each segment's name here once it is complete
+        '-segment_list', 'pipe:1',
+        '-segment_list_type', 'flat',
+        pattern,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE
+    )
+    # Drained alongside stdout: a corrupt input can log enough to fill the
+    # pipe and stall ffmpeg
+    stderr = asyncio.create_task(_read_tail(proc.stderr))
+    finished = 0
+    try:
+        # Stream copy covers a segment in well under a second; a stall this
+        # long means ffmpeg is stuck
+        while line := await asyncio.wait_for(proc.stdout.readline(), timeout=600):
+            finished += 1
+            yield os.path.join(SEGMENT_DIR, line.decode().strip())
+        await proc.wait()
+    finally:
+        if proc.returncode is None:
+            proc.kill()
+            await proc.wait()
+        if not stderr.done():
+            stderr.cancel()
+        if proc.returncode != 0:
+            # The segment ffmpeg was writing when it failed or was killed
+            _remove_quietly(pattern % finished)
+    
+    if proc.returncode != 0:
+        detail = _error_tail(await stderr)
+        raise RuntimeError(f"FFmpeg exited with code {proc.returncode}: {detail}")
+
+def _take_segment(path: str) -> bytes:
+    """
+    Read a finished segment and unlink it straight away
+    Deleted this soon, its dirty pages are mostly dropped instead of written back to disk
+    """
+    try:
+        with open(path, "rb") as f:
+            return f.read()
+    finally:
+        _remove_quietly(path)
+
+# Finished segment transcripts are kept next to the segments, keyed by a hash
+# of the model and the segment's bytes. Resubmitting a file after a crash or
+# a partly failed run re-cuts identical segments, and those skip the API.
+# The temp sweep in app.main expires them with the other segment files.
+def _transcript_cache_path(segment: bytes) -> str:
+    hasher = hashlib.sha256(TRANSCRIPTION_MODEL.encode())
+    hasher.update(segment)
+    return os.path.join(SEGMENT_DIR, f"transcript_{hasher.hexdigest()}.txt")
+
+def _load_transcript(segment: bytes) -> Tuple[str, Optional[str]]:
+    """Cache path for segment, and its transcript if one was saved"""
+    path = _transcript_cache_path(segment)
+    try:
+        with open(path, encoding="utf-8") as f:
+            return path, f.read()
+    except FileNotFoundError:
+        return path, None
+
+def _save_transcript(path: str, text: str):
+    # Written under a unique name and renamed, so a crash never leaves a
+    # truncated transcript behind
+    fd, tmp_path = tempfile.mkstemp(dir=SEGMENT_DIR, prefix="transcript_", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logger.warning(f"Failed to save transcript {path}: {e}")
+        _remove_quietly(tmp_path)
+
+# Stands in for a segment that failed in the joined transcript
+_SEGMENT_ERROR = "[片段 {index} 錯誤: {detail}]"
+_SEGMENT_ERROR_RE = re.compile(r"\[片段 \d+ 錯誤: ")
+
+def has_segment_errors(transcript: str) -> bool:
+    """Whether any segment of a transcript failed"""
+    return _SEGMENT_ERROR_RE.search(transcript) is not None
+
+def _remove_task_segments(task_id: int):
+    """Delete segments of task_id still on disk, e.g. queued when the task was cancelled"""
+    prefix = f"seg_{task_id}_"
+    with os.scandir(SEGMENT_DIR) as entries:
+        for entry in entries:
+            if entry.name.startswith(prefix):
+                _remove_quietly(entry.path)
+
+async def _delete_uploaded_file(name: str):
+    try:
+        await asyncio.to_thread(genai.delete_file, name)
+    except Exception as e:
+        logger.warning(f"Failed to delete Gemini file {name}: {e}")
+
+async def _transcribe_segment(segment_path: str, i: int, cleanups: List[asyncio.Task]) -> str:
+    """
+    Transcribe an extracted segment with Gemini; returns its text or an error marker
+    Deletion of the uploaded copy is appended to cleanups instead of awaited
+    """
+    uploaded_file = None
+    try:
+        segment = await asyncio.to_thread(_take_segment, segment_path)
+        cache_path, text = await asyncio.to_thread(_load_transcript, segment)
+        if text is not None:
+            logger.info(f"♻️ Segment {i+1} already transcribed")
+            return text
+        
+        # 1. Upload to Gemini File API from memory; retries resend the same bytes
+        logger.info(f"📤 Uploading segment {i+1} to Gemini ({len(segment)/1024/1024:.2f}MB)...")
+        
+        async with gemini_limiter:
+            uploaded_file = await _upload_to_gemini(
+                segment,
+                os.path.basename(segment_path),
+                SEGMENT_MIME_TYPES[os.path.splitext(segment_path)[1]]
+            )
+        del segment  # not needed while Gemini processes the file
+
+        # 2. Poll processing state, starting fast since short segments are
+        # usually ready within a few hundred ms
+        delay = 0.1
+        deadline = time.monotonic() + FILE_PROCESSING_TIMEOUT
+        while uploaded_file.state.name == "PROCESSING":
+            if time.monotonic() > deadline:
+                raise TimeoutError("Gemini File Processing Timed Out")
+            await asyncio.sleep(delay)
+            delay = min(delay * 1.8, 2.0)
+            uploaded_file = await asyncio.to_thread(
+                genai.get_file, uploaded_file.name
+            )
+        
+        if uploaded_file.state.name == "FAILED":
+            raise ValueError("Gemini File Processing Failed")
+
+        # 3. Generate Content; transient failures retry against the file
+        # already uploaded instead of sending the segment again
+        logger.info(f"🤖 Transcribing segment {i+1}...")
+        
+        for attempt in range(GENERATE_ATTEMPTS):
+            try:
+                async with gemini_limiter, api_semaphore:
+                    response = await asyncio.to_thread(
+                        transcription_model.generate_content,
+                        [TRANSCRIPTION_PROMPT, uploaded_file]
+                    )
+                break
+            except TRANSIENT_GEMINI_ERRORS as e:
+                if isinstance(e, google_exceptions.TooManyRequests):
+                    # Slow every task down, not just this segment's retry
+                    gemini_limiter.throttle()
+                if attempt == GENERATE_ATTEMPTS - 1:
+                    raise
+                logger.warning(f"Segment {i+1} generation failed, retrying: {e}")
+                await asyncio.sleep(2 ** attempt)
+        
+        text = response.text if response.text else ""
+
+        if text:
+            logger.info(f"✅ Segment {i+1} complete")
+            await asyncio.to_thread(_save_transcript, cache_path, text)
+            return text
+        return f"[片段 {i+1}: 無內容]"
+        
+    except Exception as e:
+        logger.error(f"Segment {i+1} error: {e}")
+        return _SEGMENT_ERROR.format(index=i+1, detail=str(e)[:100])
+    
+    finally:
+        # 4. Cleanup: the cloud copy is deleted in the background, off this
+        # segment's critical path (and now also when transcription failed).
+        # The local file was unlinked by _take_segment.
+        if uploaded_file is not None:
+            cleanups.append(asyncio.create_task(_delete_uploaded_file(uploaded_file.name)))
+
 async def transcribe_audio_file_streaming(
     file_path: str, 
     filename: str, 
     task_id: int, 
-    initial_progress: int = 0
+    initial_progress: int = 0,
+    duration_hint: int = 0
 ) -> str:
     """
-    Process audio from disk -> FFmpeg (96k Mono) -> Gemini 2.0 Flash
+    Process audio from disk -> FFmpeg (16kHz Mono) -> Gemini 2.0 Flash
+    One ffmpeg pass splits the file while up to SEGMENT_CONCURRENCY workers
+    upload and transcribe finished segments, so splitting overlaps the API
+    round trips of earlier segments
+    duration_hint is a duration the caller already knows (and has stored);
+    ffprobe only runs without one
+    The input file is left in place; the caller deletes it
     """
+    cleanups: List[asyncio.Task] = []
     try:
-        duration_seconds = await get_audio_duration(file_path)
-        
-        if duration_seconds == 0:
-            duration_seconds = SEGMENT_DURATION
-        
-        await update_task(task_id, audio_duration=duration_seconds)
+        duration_seconds = duration_hint
+        if not duration_seconds:
+            duration_seconds = await get_audio_duration(file_path)
+            if duration_seconds:
+                await update_task(task_id, audio_duration=duration_seconds)
         
-        num_segments = (duration_seconds // SEGMENT_DURATION) + (
-            1 if duration_seconds % SEGMENT_DURATION else 0
-        )
-        
-        full_text: List[str] = []
-        logger.info(f"📁 Processing {duration_seconds/60:.1f}min → {num_segments} segments with Gemini 2.0 Flash")
+        if duration_seconds:
+            segment_time = _segment_duration(duration_seconds)
+            # Only an estimate: ffmpeg cuts at packet boundaries
+            num_segments = math.ceil(duration_seconds / segment_time)
+            logger.info(f"📁 Processing {duration_seconds/60:.1f}min → {num_segments} segments of {segment_time/60:.1f}min with Gemini 2.0 Flash")
+        else:
+            # Unknown length: full-size segments, estimated as one. The
+            # stored audio_duration stays 0 rather than a made-up length.
+            segment_time = SEGMENT_DURATION
+            num_segments = 1
+            logger.info(f"📁 Processing unknown length → segments of {segment_time/60:.1f}min with Gemini 2.0 Flash")
         
         progress_range = 90 - initial_progress
+        # Not capped by num_segments, which is only an estimate; spare workers just exit
+        workers = SEGMENT_CONCURRENCY
+        # Finished segments wait here for a free worker
+        queue: asyncio.Queue = asyncio.Queue(maxsize=SEGMENT_PREFETCH)
+        # Indexed by segment, since workers finish out of order. Sized from
+        # the probed duration; ffmpeg can produce one more or one fewer.
+        full_text = [""] * num_segments
+        produced = 0
+        completed = 0
+        reported = initial_progress
         
-        for i in range(num_segments):
-            segment_path = os.path.join(SEGMENT_DIR, f"seg_{task_id}_{i}.mp3")
-            
-            try:
-                start_sec = i * SEGMENT_DURATION
-                end_sec = min((i + 1) * SEGMENT_DURATION, duration_seconds)
-                
-                logger.info(f"🔄 Segment {i+1}/{num_segments} ({start_sec}s-{end_sec}s)")
-                
-                # 1. Extract segment with optimized settings (96k Mono)
-                result = subprocess.run([
-                    'ffmpeg', '-y',
-                    '-ss', str(start_sec),
-                    '-t', str(SEGMENT_DURATION),
-                    '-i', file_path,
-                    '-ar', '44100',
-                    '-ac', '1',
-                    '-b:a', '96k',
-                    '-acodec', 'libmp3lame',
-                    '-vn',
-                    segment_path
-                ], 
-                    capture_output=True, 
-                    timeout=600,
-                    encoding='utf-8',
-                    errors='ignore'
-                )
-                
-                if result.returncode != 0 or not os.path.exists(segment_path):
-                    logger.error(f"FFmpeg failed for segment {i+1}")
-                    full_text.append(f"[片段 {i+1} 錯誤: 提取失敗]")
-                    continue
-                
-                # 2. Upload to Gemini File API
-                logger.info(f"📤 Uploading segment {i+1} to Gemini...")
-                
-                uploaded_file = await asyncio.to_thread(
-                    genai.upload_file, path=segment_path
-                )
-
-                # 3. Poll processing state
-                while uploaded_file.state.name == "PROCESSING":
-                    await asyncio.sleep(2)
-                    uploaded_file = await asyncio.to_thread(
-                        genai.get_file, uploaded_file.name
-                    )
-                
-                if uploaded_file.state.name == "FAILED":
-                    raise ValueError("Gemini File Processing Failed")
-
-                # 4. Generate Content
-                logger.info(f"🤖 Transcribing segment {i+1}...")
-                
-                model = genai.GenerativeModel(model_name=TRANSCRIPTION_MODEL)
-                
-                response = await asyncio.to_thread(
-                    model.generate_content,
-                    [
-                        "Please provide a verbatim transcription of this audio file. Do not add titles, timestamps, or speaker labels unless necessary.", 
-                        uploaded_file
-                    ]
-                )
-                
-                text = response.text if response.text else ""
-                
-                # 5. Cleanup Cloud File
-                try:
-                    await asyncio.to_thread(genai.delete_file, uploaded_file.name)
-                except:
-                    pass
-
-                if text:
-                    full_text.append(text)
-                    logger.info(f"✅ Segment {i+1} complete")
-                else:
-                    full_text.append(f"[片段 {i+1}: 無內容]")
-
-                # 6. Cleanup Local File
+        def slot() -> int:
+            if produced == len(full_text):
+                full_text.append("")
+            return produced
+        
+        async def extract_segments():
+            nonlocal produced
+            # MP3 and M4A input (which covers most YouTube downloads) is
+            # split without re-encoding; anything else, or input that can't
+            # be copied, is transcoded in the same single pass
+            copy_modes = (True, False) if _can_copy(file_path) else (False,)
+            for copy in copy_modes:
                 try:
-                    os.remove(segment_path)
-                except:
-                    pass
-                
-                # Update progress
-                segment_progress = int(initial_progress + ((i + 1) / num_segments) * progress_range)
-                await update_task(task_id, progress=segment_progress)
+                    async for segment_path in _split_audio(file_path, task_id, copy, segment_time):
+                        i = slot()
+                        logger.info(f"🔄 Segment {i+1}/{num_segments} ready")
+                        await queue.put((i, segment_path))
+                        produced += 1
+                    break
+                except Exception as e:
+                    if produced or copy is False:
+                        logger.error(f"FFmpeg failed after segment {produced}: {e}")
+                        full_text[slot()] = _SEGMENT_ERROR.format(index=produced+1, detail="提取失敗")
+                        break
+                    logger.warning(f"Stream copy failed, re-encoding instead: {e}")
+            for _ in range(workers):
+                await queue.put(None)
+        
+        async def transcribe_segments():
+            nonlocal completed, reported
+            while (item := await queue.get()) is not None:
+                i, segment_path = item
+                full_text[i] = await _transcribe_segment(segment_path, i, cleanups)
                 
-            except Exception as e:
-                logger.error(f"Segment {i+1} error: {e}")
-                full_text.append(f"[片段 {i+1} 錯誤: {str(e)[:100]}]")
-                if os.path.exists(segment_path):
-                    try: os.remove(segment_path) 
-                    except: pass
+                # Update progress; the estimated segment count can be one short,
+                # and short segments may not move it a whole percent
+                completed += 1
+                segment_progress = int(initial_progress + min(completed / num_segments, 1) * progress_range)
+                if segment_progress > reported:
+                    reported = segment_progress
+                    await update_task(task_id, progress=segment_progress)
         
-        return "\n\n".join(full_text)
+        tasks = [asyncio.create_task(extract_segments())]
+        tasks += [asyncio.create_task(transcribe_segments()) for _ in range(workers)]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            # Don't leave the producer blocked on a queue nobody reads
+            for task in tasks:
+                task.cancel()
+            raise
+        
+        # Slots past the last real segment stay empty
+        return "\n\n".join(text for text in full_text if text)
     
     finally:
-        if os.path.exists(file_path):
-            try:
-                os.remove(file_path)
-                logger.info(f"🧹 Deleted: {file_path}")
-            except Exception as e:
-                logger.warning(f"Failed to delete: {e}")
+        await asyncio.to_thread(_remove_task_segments, task_id)
+        # Failures are logged by _delete_uploaded_file
+        await asyncio.gather(*cleanups, return_exceptions=True)
 
 # ============================================================================
 # GROK-3 SUMMARY (NEW)
 # ============================================================================
 
-async def summarize_with_grok(
-    transcript: str, 
-    task_id: int, 
-    filename: str = ""
-) -> Tuple[str, str]:
-    """
-    Generate AI summary using Grok-3 API via bltcy.ai
-    Replaces Gemini summary with Grok-3
-    """
-    
-    headers = {
-        "Authorization": GROK_API_AUTHORIZATION_HEADER,
-        "Content-Type": "application/json"
-    }
-    
-    filename_context = f"檔案名稱: {filename}\n" if filename else ""
-    
-    prompt = (
-        "請根據以下演講稿進行分析，並以繁體中文回答：\n"
-        "1. 回答以下問題並以 a, b, c 格式列點(只給答案)：\n"
-        "   a. 講者是否為安利的領袖？(回答：是/否)\n"
-        f"   b. 講者的名字 (若{filename}和演講稿未提及，則回答：未提及)\n"
-        f"   c. 演講的主題 (若{filename}和演講稿未提及，則回答：未提及)\n"
-        "2. 根據上述分析，判斷講者是否為安利領袖。若是，則在總結中使用「安利領袖」稱呼講者；若否，則僅使用「講者」或講者姓名（若已知）。"
-        "請詳細歸納演講內容。\n\n"
-        f"演講稿:\n{transcript}"
-    )
-    
+# Transcripts longer than this are summarized in pieces first (map-reduce):
+# per-request latency grows with prompt tokens, and one huge prompt is also
+# what tends to hit the output cap
+SUMMARY_CHUNK_THRESHOLD = 30_000  # characters
+SUMMARY_CHUNK_SIZE = 15_000  # characters per piece
+CHUNK_SUMMARY_PROMPT = "請以繁體中文條列歸納以下演講稿片段的重點，保留講者姓名、身分與主題等資訊：\n\n{chunk}"
+
+# Piece summaries keyed by SHA-256 of the piece, so a rerun doesn't summarize it again
+CHUNK_SUMMARY_CACHE_SIZE = 256
+_chunk_summary_cache: "OrderedDict[bytes, str]" = OrderedDict()
+
+def _split_transcript(transcript: str, size: int) -> List[str]:
+    """Pack paragraphs into pieces of at most size characters, cutting only paragraphs that are longer on their own"""
+    pieces: List[str] = []
+    current = ""
+    for paragraph in transcript.split("\n\n"):
+        if len(paragraph) > size:
+            if current:
+                pieces.append(current)
+                current = ""
+            while len(paragraph) > size:
+                pieces.append(paragraph[:size])
+                paragraph = paragraph[size:]
+        if current and len(current) + 2 + len(paragraph) > size:
+            pieces.append(current)
+            current = paragraph
+        else:
+            current = f"{current}\n\n{paragraph}" if current else paragraph
+    if current:
+        pieces.append(current)
+    return pieces
+
+async def _grok_complete(prompt: str, max_tokens: int = 8192) -> str:
+    """Send one chat completion request to Grok-3 and return the reply text"""
     payload = {
         "model": GROK_MODEL_NAME,
         "messages": [
@@ -295,42 +681,77 @@ async def summarize_with_grok(
             }
         ],
         "temperature": 0.7,
-        "max_tokens": 8192
+        "max_tokens": max_tokens
     }
     
+    response = await post_with_retry(
+        GROK_API_ENDPOINT,
+        headers=GROK_HEADERS,
+        content=orjson.dumps(payload),
+        timeout=120
+    )
+    
+    response.raise_for_status()
+    response_data = orjson.loads(response.content)
+    
+    # Extract content from bltcy.ai response format
+    if 'choices' in response_data and len(response_data['choices']) > 0:
+        choice = response_data['choices'][0]
+        if 'message' in choice and 'content' in choice['message']:
+            return choice['message']['content'].strip()
+    
+    raise ValueError(f"Unexpected response structure: {orjson.dumps(response_data).decode()}")
+
+async def _summarize_chunk(chunk: str) -> str:
+    key = hashlib.sha256(chunk.encode("utf-8")).digest()
+    if key in _chunk_summary_cache:
+        _chunk_summary_cache.move_to_end(key)
+        return _chunk_summary_cache[key]
+    
+    summary = await _grok_complete(CHUNK_SUMMARY_PROMPT.format(chunk=chunk), max_tokens=2048)
+    _chunk_summary_cache[key] = summary
+    if len(_chunk_summary_cache) > CHUNK_SUMMARY_CACHE_SIZE:
+        _chunk_summary_cache.popitem(last=False)
+    return summary
+
+async def summarize_with_grok(
+    transcript: str, 
+    task_id: int, 
+    filename: str = ""
+) -> Tuple[str, str]:
+    """
+    Generate AI summary using Grok-3 API via bltcy.ai
+    Replaces Gemini summary with Grok-3
+    Long transcripts are condensed piece by piece before the final prompt
+    """
+    
+    if not transcript.strip():
+        logger.warning(f"⚠️ Empty transcript, skipping Grok-3 summary")
+        return "", "Empty transcript"
+    
     try:
         logger.info(f"🤖 Calling Grok-3 API for summary...")
         await update_task(task_id, progress=95)
         
-        session = SessionManager.get_session()
-        
-        response = await asyncio.to_thread(
-            session.post,
-            GROK_API_ENDPOINT,
-            headers=headers,
-            json=payload,
-            timeout=120
-        )
-        
-        response.raise_for_status()
-        response_data = response.json()
+        if len(transcript) > SUMMARY_CHUNK_THRESHOLD:
+            pieces = _split_transcript(transcript, SUMMARY_CHUNK_SIZE)
+            logger.info(f"✂️ Transcript is {len(transcript)} chars, summarizing {len(pieces)} pieces first")
+            summaries = await asyncio.gather(*(_summarize_chunk(piece) for piece in pieces))
+            transcript = "\n\n".join(summaries)
         
-        # Extract content from bltcy.ai response format
-        if 'choices' in response_data and len(response_data['choices']) > 0:
-            choice = response_data['choices'][0]
-            if 'message' in choice and 'content' in choice['message']:
-                summary_text = choice['message']['content'].strip()
-                logger.info(f"✅ Grok-3 summary generated successfully")
-                return summary_text, ""
-        
-        error = f"Unexpected response structure: {json.dumps(response_data)}"
-        logger.error(f"❌ Grok-3 API Error: {error}")
-        return "", error
+        prompt = SUMMARY_PROMPT_TEMPLATE.format(filename=filename, transcript=transcript)
+        summary_text = await _grok_complete(prompt)
+        logger.info(f"✅ Grok-3 summary generated successfully")
+        return summary_text, ""
             
-    except requests.exceptions.HTTPError as e:
-        error = f"HTTP {response.status_code}: {response.text}"
+    except httpx.HTTPStatusError as e:
+        error = f"HTTP {e.response.status_code}: {e.response.text}"
         logger.error(f"❌ Grok-3 HTTP Error: {error}")
         return "", error
+    except ValueError as e:
+        error = str(e)
+        logger.error(f"❌ Grok-3 API Error: {error}")
+        return "", error
     except Exception as e:
         error = f"Unexpected error: {str(e)}"
         logger.error(f"❌ Grok-3 Error: {error}")
@@ -4,17 +4,89 @@ import yt_dlp
 import tempfile
 import logging
 import asyncio
-from typing import Tuple
+import time
+import httpx
+from concurrent.futures import ThreadPoolExecutor
+import orjson
+from typing import Dict, Optional, Tuple
+from app.jobs import JOB_WORKERS
+from urllib.parse import urlsplit
 
 logger = logging.getLogger(__name__)
 
 YT_DOWNLOAD_DIR = os.path.join(tempfile.gettempdir(), "yt_downloads")
 os.makedirs(YT_DOWNLOAD_DIR, exist_ok=True)
 
-async def extract_title_only(url: str) -> str:
+# yt-dlp calls block for seconds to minutes; their own pools keep them from
+# tying up the default executor used by every asyncio.to_thread in the app,
+# and a slow download from delaying title lookups. Downloads run inside
+# jobs, so there are never more of them than job workers.
+_download_pool = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="yt-dl")
+_metadata_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="yt-meta")
+
+# Shared by title lookups and downloads, so format URLs from a cached
+# extraction are fetched with the client that requested them
+HTTP_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/130.0.0.0 Safari/537.36',
+}
+
+# yt-dlp metadata from a title lookup, handed to the download of the same
+# URL if its job starts within the TTL. The format URLs in it are signed
+# and expire after a few hours, so this stays well short of that.
+INFO_CACHE_TTL = 300  # seconds
+_info_cache: Dict[str, Tuple[float, dict]] = {}
+
+def _cache_info(url: str, info: dict):
+    now = time.monotonic()
+    for key in [k for k, (stored, _) in _info_cache.items() if now - stored > INFO_CACHE_TTL]:
+        del _info_cache[key]
+    _info_cache[url] = (now, info)
+
+def _pop_cached_info(url: str) -> Optional[dict]:
+    stored, info = _info_cache.pop(url, (0.0, None))
+    if info is not None and time.monotonic() - stored <= INFO_CACHE_TTL:
+        return info
+    return None
+
+# oEmbed returns the title in one small JSON response, instead of a full
+# yt-dlp extraction (watch page, player JS, format manifests) per URL
+OEMBED_ENDPOINTS = {
+    "youtube.com": "https://www.youtube.com/oembed",
+    "youtu.be": "https://www.youtube.com/oembed",
+    "vimeo.com": "https://vimeo.com/api/oembed.json",
+}
+
+def _oembed_endpoint(url: str) -> Optional[str]:
+    host = (urlsplit(url).hostname or "").lower()
+    for domain, endpoint in OEMBED_ENDPOINTS.items():
+        if host == domain or host.endswith("." + domain):
+            return endpoint
+    return None
+
+async def _oembed_title(client: httpx.AsyncClient, url: str) -> Optional[str]:
+    endpoint = _oembed_endpoint(url)
+    if endpoint is None:
+        return None
+    try:
+        response = await client.get(endpoint, params={"url": url, "format": "json"})
+        response.raise_for_status()
+        title = orjson.loads(response.content).get("title")
+    except (httpx.HTTPError, ValueError) as e:
+        logger.debug(f"oEmbed lookup failed for {url}: {e}")
+        return None
+    return title.strip() if title else None
+
+async def extract_title_only(url: str, client: Optional[httpx.AsyncClient] = None) -> str:
     """
     Extract only the video title without downloading
+    Tries oEmbed over the shared client first, then falls back to yt-dlp
     """
+    if client is not None:
+        title = await _oembed_title(client, url)
+        if title:
+            logger.info(f"📺 Extracted title: {title}")
+            return title
+    
     try:
         ydl_opts = {
             'quiet': True,
@@ -22,9 +94,7 @@ async def extract_title_only(url: str) -> str:
             'extract_flat': False,
             'socket_timeout': 15,
             'skip_download': True,
-            'http_headers': {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-            },
+            'http_headers': HTTP_HEADERS,
         }
         
         loop = asyncio.get_event_loop()
@@ -34,7 +104,10 @@ async def extract_title_only(url: str) -> str:
                 info = ydl.extract_info(url, download=False)
                 return info
         
-        info = await loop.run_in_executor(None, extract)
+        info = await loop.run_in_executor(_metadata_pool, extract)
+        
+        if info:
+            _cache_info(url, info)
         
         if info and 'title' in info:
             title = info['title'].strip()
@@ -50,33 +123,22 @@ async def extract_title_only(url: str) -> str:
 async def download_audio_from_url(url: str, task_id: int) -> Tuple[str, str, int]:
     """
     Download audio from YouTube/video URL using yt-dlp
-    Mono 96kbps MP3 format (Optimized for Speech AI)
+    The audio stream is kept as downloaded: the transcriber's segmenter
+    stream-copies AAC (.m4a) and transcodes anything else while splitting,
+    so a separate full-file MP3 encode here would only be redone work
     Returns: (file_path, title, duration_seconds)
     """
     output_template = os.path.join(YT_DOWNLOAD_DIR, f"yt_{task_id}_%(title)s.%(ext)s")
     
     ydl_opts = {
         'format': 'bestaudio[ext=m4a]/bestaudio[ext=webm]/bestaudio/best',
-        'postprocessors': [{
-            'key': 'FFmpegExtractAudio',
-            'preferredcodec': 'mp3',
-            'preferredquality': '96',
-            'nopostoverwrites': False,
-        }],
         'outtmpl': output_template,
         'quiet': False,
         'no_warnings': False,
         'socket_timeout': 60,
-        'postprocessor_args': [
-            '-ar', '44100',
-            '-ac', '1',
-            '-b:a', '96k',
-        ],
         'prefer_ffmpeg': True,
         'keepvideo': False,
-        'http_headers': {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/130.0.0.0 Safari/537.36',
-        },
+        'http_headers': HTTP_HEADERS,
         # ✅ SIMPLIFIED: Remove problematic extractor_args
         'retries': 5,
         'fragment_retries': 5,
@@ -90,13 +152,17 @@ async def download_audio_from_url(url: str, task_id: int) -> Tuple[str, str, int
         logger.info(f"📥 Downloading audio from: {url}")
         
         loop = asyncio.get_event_loop()
+        # Reuses the extraction done for the title, if it is recent enough
+        cached_info = _pop_cached_info(url)
         
         def download():
             with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+                if cached_info is not None:
+                    return ydl.process_ie_result(cached_info, download=True)
                 info = ydl.extract_info(url, download=True)
                 return info
         
-        info = await loop.run_in_executor(None, download)
+        info = await loop.run_in_executor(_download_pool, download)
         
         if info is None:
             raise ValueError("Failed to extract video information")
@@ -106,18 +172,13 @@ async def download_audio_from_url(url: str, task_id: int) -> Tuple[str, str, int
         
         logger.info(f"📺 Title: {title}, Duration: {duration}s")
         
-        import glob
-        pattern = os.path.join(YT_DOWNLOAD_DIR, f"yt_{task_id}_*.mp3")
-        files = glob.glob(pattern)
-        
-        if not files:
-            pattern = os.path.join(YT_DOWNLOAD_DIR, f"yt_{task_id}_*")
-            files = [f for f in glob.glob(pattern) if f.endswith(('.mp3', '.m4a', '.wav'))]
+        # yt-dlp records where each download ended up, so no directory scan is needed
+        downloads = info.get('requested_downloads') or []
+        file_path = downloads[0].get('filepath') if downloads else None
         
-        if not files:
+        if not file_path or not os.path.exists(file_path):
             raise FileNotFoundError(f"Downloaded file not found")
         
-        file_path = files[0]
         file_size = os.path.getsize(file_path)
         logger.info(f"✅ Downloaded: {file_path} ({file_size/1024/1024:.2f}MB)")
         
@@ -0,0 +1,60 @@
+# tests/conftest.py
+import asyncio
+import os
+
+import httpx
+import pytest
+
+# app.main and app.transcriber refuse to import without these
+os.environ.setdefault("VALID_API_KEY", "test-key")
+os.environ.setdefault("GEMINI_API_KEY", "test-gemini-key")
+os.environ.setdefault("AI_SUMMARY_API_AUTHORIZATION_HEADER", "Bearer test")
+
+from app import db, main
+from app.jobs import job_queue
+
+API_KEY = os.environ["VALID_API_KEY"]
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+@pytest.fixture
+async def database(tmp_path, monkeypatch):
+    """A fresh database file with the shared connections open"""
+    monkeypatch.setattr(db, "DB_FILE", str(tmp_path / "tasks.db"))
+    await db.init_db()
+    yield
+    await db.close_db()
+    db._task_owners.clear()
+
+@pytest.fixture
+async def client(database, tmp_path, monkeypatch):
+    """Client for the app, with uploads and results kept under tmp_path"""
+    for name in ("RESULTS_DIR", "UPLOAD_DIR"):
+        directory = tmp_path / name.lower()
+        directory.mkdir()
+        monkeypatch.setattr(main, name, directory)
+    job_queue.start()
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+        yield http
+    await job_queue.stop()
+
+async def upload(client, *files, summarize=False, api_key=API_KEY):
+    """POST files, given as (filename, content) pairs, to /transcribe"""
+    return await client.post(
+        "/transcribe",
+        data={"api_key": api_key, "summarize": str(summarize).lower()},
+        files=[("files", (name, content)) for name, content in files],
+    )
+
+async def wait_until_finished(task_id: int, timeout: float = 30) -> db.Task:
+    """Poll a task until it is done or failed"""
+    async with asyncio.timeout(timeout):
+        while True:
+            await db.flush_progress()
+            task = await db.get_task(task_id)
+            if task.status in ("done", "error"):
+                return task
+            await asyncio.sleep(0.05)
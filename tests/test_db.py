@@ -0,0 +1,120 @@
+# tests/test_db.py
+import asyncio
+import sqlite3
+
+import pytest
+
+from app import db
+
+pytestmark = pytest.mark.anyio
+
+# The tasks table as the first release created it, before schema versioning
+BASELINE_SCHEMA = """
+    CREATE TABLE tasks (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        api_key TEXT NOT NULL,
+        status TEXT NOT NULL,
+        progress INTEGER NOT NULL,
+        filename TEXT NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        file_size INTEGER DEFAULT 0,
+        audio_duration INTEGER DEFAULT 0,
+        result_file TEXT,
+        error TEXT,
+        source_type TEXT DEFAULT 'upload',
+        source_url TEXT
+    )
+"""
+
+@pytest.mark.parametrize("user_version", [0, 1])
+async def test_migrates_baseline_database(tmp_path, monkeypatch, user_version):
+    path = tmp_path / "tasks.db"
+    with sqlite3.connect(path) as conn:
+        conn.execute(BASELINE_SCHEMA)
+        conn.executemany(
+            "INSERT INTO tasks (api_key, status, progress, filename) VALUES (?, 'done', 100, ?)",
+            [("key-a", "a1.mp3"), ("key-b", "b1.mp3"), ("key-a", "a2.mp3")],
+        )
+        conn.execute(f"PRAGMA user_version={user_version}")
+    conn.close()
+
+    monkeypatch.setattr(db, "DB_FILE", str(path))
+    await db.init_db()
+    try:
+        assert sorted(task.filename for task in await db.get_tasks_for_key("key-a")) == ["a1.mp3", "a2.mp3"]
+        assert [task.filename for task in await db.get_tasks_for_key("key-b")] == ["b1.mp3"]
+    finally:
+        await db.close_db()
+
+    conn = sqlite3.connect(path)
+    try:
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(tasks)")}
+        indexes = {row[1] for row in conn.execute("PRAGMA index_list(tasks)")}
+        assert conn.execute("PRAGMA user_version").fetchone() == (db.SCHEMA_VERSION,)
+        assert conn.execute("PRAGMA auto_vacuum").fetchone() == (2,)
+    finally:
+        conn.close()
+    assert "api_key" not in columns
+    assert {"api_key_hash", "content_hash"} <= columns
+    assert {"ix_tasks_keyhash_created", "ix_tasks_created", "ix_tasks_keyhash_content"} <= indexes
+
+async def test_new_database_is_current(database):
+    conn = sqlite3.connect(db.DB_FILE)
+    try:
+        assert conn.execute("PRAGMA user_version").fetchone() == (db.SCHEMA_VERSION,)
+        assert conn.execute("PRAGMA auto_vacuum").fetchone() == (2,)
+    finally:
+        conn.close()
+
+async def test_create_tasks_bulk_returns_ids_in_row_order(database):
+    assert await db.create_tasks_bulk([]) == []
+    first = await db.create_task("key", "single.mp3")
+
+    rows = [("key", f"file{i}.mp3", i, 0, "upload", None, None) for i in range(5)]
+    task_ids = await db.create_tasks_bulk(rows)
+
+    assert task_ids == list(range(first + 1, first + 6))
+    for i, task_id in enumerate(task_ids):
+        task = await db.get_task(task_id)
+        assert (task.filename, task.file_size, task.status) == (f"file{i}.mp3", i, "pending")
+        assert task.api_key_hash == db.hash_api_key("key")
+
+async def test_progress_updates_are_buffered_until_flushed(database, monkeypatch):
+    monkeypatch.setattr(db, "_PROGRESS_FLUSH_INTERVAL", 3600)
+    task_id = await db.create_task("key", "talk.mp3")
+    notified = []
+    db.add_task_listener(db.hash_api_key("key"), notified.append)
+    try:
+        await db.update_task(task_id, progress=10)
+        await db.update_task(task_id, progress=20)
+        assert (await db.get_task(task_id)).progress == 0
+        assert notified == []
+
+        await db.flush_progress()
+        assert (await db.get_task(task_id)).progress == 20
+        assert notified == [task_id]
+    finally:
+        db.remove_task_listener(db.hash_api_key("key"), notified.append)
+
+async def test_other_updates_write_buffered_progress(database, monkeypatch):
+    monkeypatch.setattr(db, "_PROGRESS_FLUSH_INTERVAL", 3600)
+    task_id = await db.create_task("key", "talk.mp3")
+
+    await db.update_task(task_id, progress=30)
+    await db.update_task(task_id, status="processing")
+    task = await db.get_task(task_id)
+    assert (task.status, task.progress) == ("processing", 30)
+
+    # Nothing is left for the flusher to write over later updates
+    await db.update_task(task_id, status="done", progress=100)
+    await db.flush_progress()
+    assert (await db.get_task(task_id)).progress == 100
+
+async def test_background_flusher_writes_progress(database, monkeypatch):
+    monkeypatch.setattr(db, "_PROGRESS_FLUSH_INTERVAL", 0.01)
+    task_id = await db.create_task("key", "talk.mp3")
+
+    await db.update_task(task_id, progress=40)
+    async with asyncio.timeout(5):
+        while (await db.get_task(task_id)).progress != 40:
+            await asyncio.sleep(0.01)
@@ -0,0 +1,24 @@
+# tests/test_transcriber.py
+import math
+
+import pytest
+
+from app.transcriber import MIN_SEGMENT_DURATION, SEGMENT_CONCURRENCY, SEGMENT_DURATION, _segment_duration, has_segment_errors
+
+@pytest.mark.parametrize("duration", [0, 1, 60, MIN_SEGMENT_DURATION * SEGMENT_CONCURRENCY])
+def test_short_files_use_the_minimum_segment(duration):
+    assert _segment_duration(duration) == MIN_SEGMENT_DURATION
+
+def test_medium_files_are_spread_over_every_worker():
+    duration = (MIN_SEGMENT_DURATION + 30) * SEGMENT_CONCURRENCY + 1
+    segment = _segment_duration(duration)
+    assert MIN_SEGMENT_DURATION < segment < SEGMENT_DURATION
+    assert math.ceil(duration / segment) == SEGMENT_CONCURRENCY
+
+@pytest.mark.parametrize("duration", [SEGMENT_DURATION * SEGMENT_CONCURRENCY, 5 * 3600])
+def test_long_files_use_the_maximum_segment(duration):
+    assert _segment_duration(duration) == SEGMENT_DURATION
+
+def test_segment_errors_are_detected():
+    assert has_segment_errors("一\n\n[片段 2 錯誤: timeout]")
+    assert not has_segment_errors("講者說這是一個錯誤\n\n[片段 3: 無內容]")
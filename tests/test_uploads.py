@@ -0,0 +1,253 @@
+# tests/test_uploads.py
+import shutil
+import subprocess
+from types import SimpleNamespace
+
+import pytest
+
+from app import main, transcriber
+from tests.conftest import API_KEY, upload, wait_until_finished
+
+pytestmark = pytest.mark.anyio
+
+AUDIO = b"ID3" + bytes(4096)
+
+@pytest.fixture
+def transcripts(monkeypatch):
+    """Replace transcription with canned transcripts, one per call"""
+    queued = []
+    calls = []
+
+    async def fake_transcribe(file_path, filename, task_id, **kwargs):
+        calls.append(filename)
+        return queued.pop(0)
+
+    monkeypatch.setattr(main, "transcribe_audio_file_streaming", fake_transcribe)
+    return queued, calls
+
+async def test_failed_segment_result_is_not_reused(client, transcripts):
+    queued, calls = transcripts
+    queued += ["第一段\n\n[片段 2 錯誤: 500 Internal error]", "第一段\n\n第二段"]
+
+    first = await upload(client, ("talk.mp3", AUDIO))
+    (first_id,) = first.json()["task_ids"]
+    assert (await wait_until_finished(first_id)).status == "done"
+
+    # Resubmitting to retry the failed segment runs the job again
+    second = await upload(client, ("talk.mp3", AUDIO))
+    (second_id,) = second.json()["task_ids"]
+    assert (await wait_until_finished(second_id)).status == "done"
+    assert len(calls) == 2
+
+    # The clean result is the one reused from then on
+    third = await upload(client, ("talk.mp3", AUDIO))
+    (third_id,) = third.json()["task_ids"]
+    await wait_until_finished(third_id)
+    assert len(calls) == 2
+    result = await client.get(f"/download/{third_id}", params={"api_key": main.VALID_API_KEY})
+    assert result.text == "第一段\n\n第二段"
+
+async def test_failed_summary_result_is_not_reused(client, transcripts, monkeypatch):
+    queued, calls = transcripts
+    queued += ["講稿", "講稿"]
+    summaries = [("", "HTTP 503: unavailable"), ("總結", "")]
+
+    async def fake_summarize(transcript, task_id, filename=""):
+        return summaries.pop(0)
+
+    monkeypatch.setattr(main, "summarize_with_gemini", fake_summarize)
+
+    for _ in range(2):
+        response = await upload(client, ("talk.mp3", AUDIO), summarize=True)
+        (task_id,) = response.json()["task_ids"]
+        assert (await wait_until_finished(task_id)).status == "done"
+    assert len(calls) == 2
+    assert not summaries
+
+@pytest.fixture
+def speech(tmp_path) -> bytes:
+    """Five seconds of MP3, which the patched segment length cuts into three"""
+    path = tmp_path / "speech.mp3"
+    subprocess.run(
+        ["ffmpeg", "-v", "error", "-f", "lavfi", "-i", "sine=frequency=440:duration=5",
+         "-ac", "1", "-ar", "16000", "-c:a", "libmp3lame", str(path)],
+        check=True,
+    )
+    return path.read_bytes()
+
+@pytest.fixture
+def gemini(tmp_path, monkeypatch):
+    """Stand-in for the Gemini File API and model; fails the segment numbers in `failing`"""
+    segment_dir = tmp_path / "segments"
+    segment_dir.mkdir()
+    monkeypatch.setattr(transcriber, "SEGMENT_DIR", str(segment_dir))
+    monkeypatch.setattr(transcriber, "SEGMENT_DURATION", 2)
+    monkeypatch.setattr(transcriber, "MIN_SEGMENT_DURATION", 1)
+
+    fake = SimpleNamespace(failing=set(), generated=[])
+
+    async def upload_to_gemini(data, display_name, mime_type="audio/mpeg"):
+        return SimpleNamespace(name=display_name, state=SimpleNamespace(name="ACTIVE"))
+
+    def generate_content(contents):
+        # Segment files are named seg_<task>_<index>.<ext>
+        index = int(contents[1].name.rsplit("_", 1)[1].split(".")[0])
+        fake.generated.append(index)
+        if index in fake.failing:
+            raise ValueError("model unavailable")
+        return SimpleNamespace(text=f"segment {index}")
+
+    async def delete_uploaded_file(name):
+        pass
+
+    monkeypatch.setattr(transcriber, "_upload_to_gemini", upload_to_gemini)
+    monkeypatch.setattr(transcriber.transcription_model, "generate_content", generate_content)
+    monkeypatch.setattr(transcriber, "_delete_uploaded_file", delete_uploaded_file)
+    return fake
+
+@pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="needs ffmpeg")
+async def test_reupload_only_retranscribes_failed_segments(client, gemini, speech):
+    gemini.failing = {1}
+    first = await upload(client, ("talk.mp3", speech))
+    (first_id,) = first.json()["task_ids"]
+    assert (await wait_until_finished(first_id)).status == "done"
+    assert sorted(gemini.generated) == [0, 1, 2]
+
+    gemini.failing = set()
+    gemini.generated.clear()
+    second = await upload(client, ("talk.mp3", speech))
+    (second_id,) = second.json()["task_ids"]
+    assert (await wait_until_finished(second_id)).status == "done"
+    assert gemini.generated == [1]
+
+    result = await client.get(f"/download/{second_id}", params={"api_key": main.VALID_API_KEY})
+    assert result.text == "segment 0\n\nsegment 1\n\nsegment 2"
+
+async def test_reuse_replaces_leftover_result_file(client, transcripts):
+    queued, calls = transcripts
+    queued.append("講稿")
+
+    first = await upload(client, ("talk.mp3", AUDIO))
+    (first_id,) = first.json()["task_ids"]
+    done = await wait_until_finished(first_id)
+
+    # Left over from a database that was since reset; already the same inode
+    leftover = main.RESULTS_DIR / f"result_{first_id + 1}.txt"
+    leftover.hardlink_to(done.result_file)
+
+    second = await upload(client, ("talk.mp3", AUDIO))
+    (second_id,) = second.json()["task_ids"]
+    assert second_id == first_id + 1
+    assert (await wait_until_finished(second_id)).result_file == str(leftover)
+    assert len(calls) == 1
+
+@pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="needs ffmpeg")
+async def test_failed_probe_leaves_duration_unset(client, gemini, speech, monkeypatch):
+    async def failed_probe(file_path):
+        return 0
+
+    monkeypatch.setattr(main, "get_audio_duration", failed_probe)
+    monkeypatch.setattr(transcriber, "get_audio_duration", failed_probe)
+
+    response = await upload(client, ("talk.mp3", speech))
+    (task_id,) = response.json()["task_ids"]
+    task = await wait_until_finished(task_id)
+    assert task.status == "done"
+    assert task.audio_duration == 0
+
+async def test_oversized_field_is_rejected(client, monkeypatch):
+    monkeypatch.setattr(main, "MAX_FORM_FIELD_SIZE", 1024)
+    response = await client.post(
+        "/transcribe",
+        data={"api_key": API_KEY, "summarize": "x" * 2048},
+        files=[("files", ("talk.mp3", AUDIO))],
+    )
+    assert response.status_code == 413
+    assert not any(main.UPLOAD_DIR.iterdir())
+
+async def test_too_many_parts_are_rejected(client, monkeypatch):
+    monkeypatch.setattr(main, "MAX_FORM_PARTS", 3)
+    response = await client.post(
+        "/transcribe",
+        data={"api_key": API_KEY, "summarize": "false"},
+        files=[("files", (f"talk{i}.mp3", AUDIO)) for i in range(2)],
+    )
+    assert response.status_code == 413
+    assert not any(main.UPLOAD_DIR.iterdir())
+
+async def test_invalid_key_is_rejected_before_files_are_written(client, transcripts):
+    response = await upload(client, ("talk.mp3", AUDIO), api_key="wrong")
+    assert response.status_code == 401
+    assert not any(main.UPLOAD_DIR.iterdir())
+
+async def test_missing_key_is_rejected(client, transcripts):
+    response = await client.post("/transcribe", files=[("files", ("talk.mp3", AUDIO))])
+    assert response.status_code == 401
+    assert not any(main.UPLOAD_DIR.iterdir())
+
+async def test_upload_without_usable_files_is_rejected(client, transcripts):
+    assert (await client.post("/transcribe", data={"api_key": API_KEY})).status_code == 400
+    response = await upload(client, ("notes.txt", b"text"))
+    assert response.status_code == 400
+    assert not any(main.UPLOAD_DIR.iterdir())
+
+async def test_truncated_body_leaves_no_files(client, transcripts):
+    boundary = "b0undary"
+    body = (
+        f"--{boundary}\r\n"
+        'Content-Disposition: form-data; name="api_key"\r\n\r\n'
+        f"{API_KEY}\r\n"
+        f"--{boundary}\r\n"
+        'Content-Disposition: form-data; name="files"; filename="talk.mp3"\r\n\r\n'
+    ).encode() + AUDIO
+    response = await client.post(
+        "/transcribe",
+        content=body,
+        headers={"Content-Type": f"multipart/form-data; boundary={boundary}"},
+    )
+    assert response.status_code == 400
+    assert not any(main.UPLOAD_DIR.iterdir())
+
+async def test_upload_creates_a_task_per_file(client, transcripts):
+    queued, calls = transcripts
+    queued += ["一", "二"]
+
+    response = await upload(client, ("one.mp3", AUDIO), ("two.m4a", AUDIO + b"2"))
+    task_ids = response.json()["task_ids"]
+    assert len(task_ids) == 2
+    for task_id in task_ids:
+        assert (await wait_until_finished(task_id)).status == "done"
+    assert sorted(calls) == ["one.mp3", "two.m4a"]
+    assert not any(main.UPLOAD_DIR.iterdir())
+
+async def test_identical_upload_reuses_result(client, transcripts):
+    queued, calls = transcripts
+    queued.append("講稿")
+
+    first = await upload(client, ("talk.mp3", AUDIO))
+    (first_id,) = first.json()["task_ids"]
+    await wait_until_finished(first_id)
+
+    # Transcripts don't depend on the filename
+    second = await upload(client, ("renamed.mp3", AUDIO))
+    (second_id,) = second.json()["task_ids"]
+    assert second_id != first_id
+    assert (await wait_until_finished(second_id)).status == "done"
+    assert calls == ["talk.mp3"]
+    result = await client.get(f"/download/{second_id}", params={"api_key": API_KEY})
+    assert result.text == "講稿"
+
+async def test_summary_is_only_reused_under_the_same_filename(client, transcripts, monkeypatch):
+    queued, calls = transcripts
+    queued += ["講稿", "講稿"]
+
+    async def fake_summarize(transcript, task_id, filename=""):
+        return f"總結 {filename}", ""
+
+    monkeypatch.setattr(main, "summarize_with_gemini", fake_summarize)
+
+    for name in ("talk.mp3", "talk.mp3", "other.mp3"):
+        response = await upload(client, (name, AUDIO), summarize=True)
+        (task_id,) = response.json()["task_ids"]
+        assert (await wait_until_finished(task_id)).status == "done"
+    assert calls == ["talk.mp3", "other.mp3"]